@@ -0,0 +1,164 @@
+# attempt_history.py
+import time
+import heapq
+import sqlite3
+import logging
+from contextlib import closing
+
+from constants import (
+    HISTORY_FILE,
+    HISTORY_MAX_ROWS,
+    HISTORY_COMPACT_EVERY,
+    LOGIN_SUCCESSFUL,
+    ALREADY_CONNECTED
+)
+
+# Span names (see tracing.span) stored as per-phase durations
+PHASE_COLUMNS = {
+    'probe': 'probe_ms',
+    'post': 'post_ms',
+    'teardown': 'teardown_ms',
+    'verify': 'verify_ms',
+    'try_login': 'total_ms',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    ts REAL NOT NULL,
+    location TEXT,
+    status TEXT NOT NULL,
+    retries INTEGER NOT NULL DEFAULT 0,
+    probe_ms REAL,
+    post_ms REAL,
+    teardown_ms REAL,
+    verify_ms REAL,
+    total_ms REAL
+);
+CREATE INDEX IF NOT EXISTS attempts_ts ON attempts(ts);
+CREATE INDEX IF NOT EXISTS attempts_status_location_total ON attempts(status, location, total_ms);
+"""
+
+# Statuses meaning the machine was online after the attempt
+ONLINE_STATUSES = (LOGIN_SUCCESSFUL, ALREADY_CONNECTED)
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(HISTORY_FILE)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def record_attempt(status: str, location: str | None, retries: int, phases: dict):
+    """Appends one login attempt with its per-phase durations (ms). Errors are logged, never raised."""
+    values = {column: phases.get(phase) for phase, column in PHASE_COLUMNS.items()}
+    try:
+        with closing(_connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT INTO attempts (ts, location, status, retries, probe_ms, post_ms, teardown_ms, verify_ms, total_ms) "
+                "VALUES (:ts, :location, :status, :retries, :probe_ms, :post_ms, :teardown_ms, :verify_ms, :total_ms)",
+                {"ts": time.time(), "location": location, "status": status, "retries": retries, **values}
+            )
+            if cursor.lastrowid % HISTORY_COMPACT_EVERY == 0:
+                _compact(conn, cursor.lastrowid)
+    except sqlite3.Error as e:
+        logging.error(f"Error recording attempt in history: {e}")
+
+
+def _compact(conn: sqlite3.Connection, last_rowid: int):
+    """Drops the oldest attempts so that at most HISTORY_MAX_ROWS remain."""
+    deleted = conn.execute("DELETE FROM attempts WHERE rowid <= ?", (last_rowid - HISTORY_MAX_ROWS,)).rowcount
+    if deleted:
+        logging.info(f"Attempt history compacted: {deleted} old attempts removed.")
+
+
+def _percentile(conn: sqlite3.Connection, where: str, params: tuple, count: int, fraction: float) -> float | None:
+    """Nearest-rank percentile of total_ms over the rows matching where, fetched as a single row."""
+    if count == 0:
+        return None
+    offset = min(count - 1, int(fraction * count))
+    row = conn.execute(
+        f"SELECT total_ms FROM attempts WHERE {where} ORDER BY total_ms LIMIT 1 OFFSET ?",
+        (*params, offset)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _group_stats(conn: sqlite3.Connection, group_expr: str) -> list[dict]:
+    """
+    Success rate and p50/p95 time-to-connect for each value of group_expr.
+    ALREADY_CONNECTED attempts are counted but left out of the success rate: no login was made.
+    """
+    groups = conn.execute(
+        f"SELECT {group_expr} AS grp, COUNT(*), SUM(status != ?), "
+        f"SUM(status = ?), SUM(status = ? AND total_ms IS NOT NULL) "
+        f"FROM attempts GROUP BY grp ORDER BY grp",
+        (ALREADY_CONNECTED, LOGIN_SUCCESSFUL, LOGIN_SUCCESSFUL)
+    ).fetchall()
+
+    results = []
+    for group, total, logins, successes, timed in groups:
+        where = f"status = ? AND total_ms IS NOT NULL AND {group_expr} IS ?"
+        params = (LOGIN_SUCCESSFUL, group)
+        results.append({
+            "group": group,
+            "attempts": total,
+            "logins": logins,
+            "success_rate": successes / logins if logins else None,
+            "p50_ms": _percentile(conn, where, params, timed, 0.50),
+            "p95_ms": _percentile(conn, where, params, timed, 0.95),
+        })
+    return results
+
+
+def _worst_outages(conn: sqlite3.Connection, limit: int) -> list[dict]:
+    """Longest runs of consecutive failed attempts, streamed in time order."""
+    worst = [] # Min-heap of (duration_s, start_ts, end_ts, failed_attempts)
+
+    def push(entry):
+        if len(worst) < limit:
+            heapq.heappush(worst, entry)
+        else:
+            heapq.heappushpop(worst, entry)
+
+    outage_start = last_ts = None
+    failed = 0
+    for ts, status in conn.execute("SELECT ts, status FROM attempts ORDER BY ts"):
+        last_ts = ts
+        if status in ONLINE_STATUSES:
+            if outage_start is not None:
+                push((ts - outage_start, outage_start, ts, failed))
+            outage_start, failed = None, 0
+        else:
+            if outage_start is None:
+                outage_start = ts
+            failed += 1
+    if outage_start is not None: # Still offline at the last recorded attempt
+        push((last_ts - outage_start, outage_start, last_ts, failed))
+
+    return [
+        {"duration_s": duration, "start": start, "end": end, "failed_attempts": count}
+        for duration, start, end, count in sorted(worst, reverse=True)
+    ]
+
+
+def compute_stats(worst_outages: int = 5) -> dict | None:
+    """
+    Aggregates the history per location and per hour of day without loading it in memory.
+    Returns None if there is no history yet.
+    """
+    try:
+        with closing(_connect()) as conn:
+            total, first_ts, last_ts = conn.execute("SELECT COUNT(*), MIN(ts), MAX(ts) FROM attempts").fetchone()
+            if not total:
+                return None
+            return {
+                "attempts": total,
+                "first": first_ts,
+                "last": last_ts,
+                "by_location": _group_stats(conn, "location"),
+                "by_hour": _group_stats(conn, "CAST(strftime('%H', ts, 'unixepoch', 'localtime') AS INTEGER)"),
+                "worst_outages": _worst_outages(conn, worst_outages),
+            }
+    except sqlite3.Error as e:
+        logging.error(f"Error reading attempt history: {e}")
+        return None
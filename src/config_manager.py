@@ -2,72 +2,76 @@
 import os
 import configparser
 import logging
-from constants import CONFIG_FILE, DEFAULT_USERNAME_PLACEHOLDER
+from constants import CONFIG_FILE, CONFIG_SCHEMA_VERSION, DEFAULT_USERNAME_PLACEHOLDER
+
+DEFAULT_LOCATIONS = {
+    'viola': 'https://sw-prviola.unipi.it:444',
+    'blu': 'https://sw-prblu.unipi.it:444',
+    'verde': 'https://sw-prverde.unipi.it:444',
+    'giallo': 'https://sw-prgiallo.unipi.it:444',
+    'arancio': 'https://sw-prarancio.unipi.it:444',
+    'rosso': 'https://sw-prrosso.unipi.it:444'
+}
 
 def create_default_config():
     """Creates a default configuration file."""
     config = configparser.ConfigParser()
     config['GeneralSettings'] = {
+        'SchemaVersion': str(CONFIG_SCHEMA_VERSION),
         'Username': DEFAULT_USERNAME_PLACEHOLDER, # Store username for keyring, not a secret itself
         'HasFirstRun': 'true', # Set to true, main logic will handle first-time credential input
         'LastConnectedLocation': ''
     }
-    config['Locations'] = {
-        'viola': 'https://sw-prviola.unipi.it:444',
-        'blu': 'https://sw-prblu.unipi.it:444',
-        'verde': 'https://sw-prverde.unipi.it:444',
-        'giallo': 'https://sw-prgiallo.unipi.it:444',
-        'arancio': 'https://sw-prarancio.unipi.it:444',
-        'rosso': 'https://sw-prrosso.unipi.it:444'
-    }
-    with open(CONFIG_FILE, 'w') as configfile:
-        config.write(configfile)
+    config['Locations'] = dict(DEFAULT_LOCATIONS)
+    save_config(config)
     logging.info(f"Default config file created at {CONFIG_FILE}")
     return config
 
-def load_config() -> tuple[configparser.ConfigParser, bool]:
-    """Loads configuration. Returns config object and a boolean indicating if it was the first run (based on content)."""
-    config = configparser.ConfigParser()
-    is_newly_created = False
-    if not os.path.exists(CONFIG_FILE):
-        config = create_default_config()
-        is_newly_created = True # A default config is created, effectively a first run state for setup
+def _is_valid(config: configparser.ConfigParser) -> bool:
+    """Checks that the config is at the current schema version with every required key."""
+    if 'GeneralSettings' not in config or 'Locations' not in config:
+        return False
+    general = config['GeneralSettings']
+    return (general.get('SchemaVersion') == str(CONFIG_SCHEMA_VERSION) and
+            all(key in general for key in ('Username', 'HasFirstRun', 'LastConnectedLocation')))
 
-    config.read(CONFIG_FILE)
+def _is_first_run(config: configparser.ConfigParser) -> bool:
+    # First run is true if 'HasFirstRun' is explicitly true in config
+    # OR if username is still the placeholder (meaning setup wasn't completed)
+    return config.getboolean('GeneralSettings', 'HasFirstRun', fallback=True) or \
+           config.get('GeneralSettings', 'Username', fallback=DEFAULT_USERNAME_PLACEHOLDER) == DEFAULT_USERNAME_PLACEHOLDER
 
-    # Ensure sections and keys exist, add if missing (migration for older configs)
+def _migrate_config(config: configparser.ConfigParser):
+    """Brings an older config up to CONFIG_SCHEMA_VERSION, adding missing sections and keys."""
     if 'GeneralSettings' not in config:
         config['GeneralSettings'] = {}
-        is_newly_created = True # Treat as first run if critical section missing
-    if 'Username' not in config['GeneralSettings']:
-        config['GeneralSettings']['Username'] = DEFAULT_USERNAME_PLACEHOLDER
-        is_newly_created = True
-    if 'HasFirstRun' not in config['GeneralSettings']:
-        config['GeneralSettings']['HasFirstRun'] = 'true' # Default to true, prompt for creds if user/pass missing
-        is_newly_created = True
-    if 'LastConnectedLocation' not in config['GeneralSettings']:
-        config['GeneralSettings']['LastConnectedLocation'] = ''
-
+    general = config['GeneralSettings']
+    if 'Username' not in general:
+        general['Username'] = DEFAULT_USERNAME_PLACEHOLDER
+    if 'HasFirstRun' not in general:
+        general['HasFirstRun'] = 'true' # Default to true, prompt for creds if user/pass missing
+    if 'LastConnectedLocation' not in general:
+        general['LastConnectedLocation'] = ''
     if 'Locations' not in config:
-        config['Locations'] = {
-            'viola': 'https://sw-prviola.unipi.it:444',
-            'blu': 'https://sw-prblu.unipi.it:444',
-            'verde': 'https://sw-prverde.unipi.it:444',
-            'giallo': 'https://sw-prgiallo.unipi.it:444',
-            'arancio': 'https://sw-prarancio.unipi.it:444',
-            'rosso': 'https://sw-prrosso.unipi.it:444'
-        }
-        is_newly_created = True
+        config['Locations'] = dict(DEFAULT_LOCATIONS)
+    general['SchemaVersion'] = str(CONFIG_SCHEMA_VERSION)
+    logging.info(f"Configuration migrated to schema version {CONFIG_SCHEMA_VERSION}.")
 
-    if is_newly_created: # Save if we modified it or created it
-        save_config(config)
-
-    # First run is true if 'HasFirstRun' is explicitly true in config
-    # OR if username is still the placeholder (meaning setup wasn't completed)
-    is_first_run_logic = config.getboolean('GeneralSettings', 'HasFirstRun', fallback=True) or \
-                         config['GeneralSettings']['Username'] == DEFAULT_USERNAME_PLACEHOLDER
+def load_config() -> tuple[configparser.ConfigParser, bool]:
+    """
+    Loads configuration. Returns config object and a boolean indicating if it was the first run (based on content).
+    The file is migrated (then saved) only when it is not at the current schema version.
+    """
+    if not os.path.exists(CONFIG_FILE):
+        config = create_default_config()
+        return config, True # A default config is created, effectively a first run state for setup
 
-    return config, is_first_run_logic
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    if not _is_valid(config):
+        _migrate_config(config)
+        save_config(config)
+    return config, _is_first_run(config)
 
 
 def save_config(config: configparser.ConfigParser):
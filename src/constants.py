@@ -7,7 +7,14 @@ APP_DIR = os.path.join(os.getenv('APPDATA', ''), APP_NAME) # os.getenv default f
 EXE_NAME = "PratiLogin.exe" # Assuming it will be compiled
 EXE_PATH = os.path.join(APP_DIR, EXE_NAME)
 CONFIG_FILE = os.path.join(APP_DIR, "config.ini")
+HISTORY_FILE = os.path.join(APP_DIR, "attempts.sqlite3") # Structured log of every login attempt
+FINGERPRINT_FILE = os.path.join(APP_DIR, "fingerprints.ini") # Learned network fingerprint -> location map
 LOG_FILE = os.path.join(APP_DIR, "autologin.log")
+PROFILE_STATS_FILE = os.path.join(APP_DIR, "profile.pstats") # Written by --profile
+TRACE_FILE = os.path.join(APP_DIR, "login_trace.json") # Chrome trace (chrome://tracing, Perfetto)
+
+# --- CONFIG ---
+CONFIG_SCHEMA_VERSION = 2 # Bump when load_config needs to migrate existing files
 
 # --- KEYRING ---
 KEYRING_SERVICE_NAME = "FastPratilogin_UNIPI"
@@ -17,10 +24,19 @@ KEYRING_SERVICE_NAME = "FastPratilogin_UNIPI"
 NETWORK_CHECK_TIMEOUT = 5  # For general internet check
 LOGIN_SERVER_REACH_TIMEOUT = 0.7 # For initial GET to login server
 LOGIN_AUTH_TIMEOUT = 1.5         # For POST request during login
+LOGIN_VERIFY_POLL_DELAYS = (0.2, 0.4, 0.8, 1.6) # Backoff between internet checks after a login POST 200
+LOGIN_VERIFY_MAX_WAIT = 4 # Seconds after the POST past which no new internet check is started
+
+# Cheap connectivity probes, tried in order of cost before the full internet check
+PROBE_TIMEOUT = 1.0
+PROBE_TLS_TARGET = ("1.1.1.1", 443) # Public resolver's HTTPS port, by IP (no DNS lookup)
+PROBE_TLS_HOSTNAME = "one.one.one.one" # Name its certificate is verified against
+PROBE_HTTP_204_URL = "http://clients3.google.com/generate_204"
 
 # --- LOGGING ---
 MAX_FORCE_RETRIES = 5 # Max retries for forced login
 FORCE_RETRY_DELAY = 1 # Seconds
+FANOUT_MAX_WORKERS = 6 # Concurrent locations in fan-out force mode (--fan-out)
 
 # Define status constants for try_login return
 LOGIN_SUCCESSFUL = "LOGIN_SUCCESSFUL"
@@ -30,6 +46,34 @@ REACHABLE_POST_ERROR = "REACHABLE_POST_ERROR" # General POST failure after succe
 NO_LOCATION_REACHABLE = "NO_LOCATION_REACHABLE"
 ALREADY_CONNECTED = "ALREADY_CONNECTED"
 MISSING_CREDENTIALS = "MISSING_CREDENTIALS"
+MISSING_LOCATIONS = "MISSING_LOCATIONS" # No locations in config (only reported by --once)
+LOGIN_ABANDONED = "LOGIN_ABANDONED" # Fan-out attempt stopped because another location claimed the win first
+
+# Process exit codes for --once, one per status (1 is left for unexpected errors)
+EXIT_CODES = {
+    LOGIN_SUCCESSFUL: 0,
+    ALREADY_CONNECTED: 2,
+    REACHABLE_AUTH_FAILED_401: 3,
+    REACHABLE_AUTH_OK_NO_INTERNET: 4,
+    REACHABLE_POST_ERROR: 5,
+    NO_LOCATION_REACHABLE: 6,
+    MISSING_CREDENTIALS: 7,
+    MISSING_LOCATIONS: 8,
+} # LOGIN_ABANDONED is internal to fan-out and never the result of a login
+EXIT_CODE_UNEXPECTED_ERROR = 1
+
+# --- MONITOR (power-saving scheduler) ---
+MONITOR_PROBE_INTERVAL = 30 # Seconds between connectivity probes while the link is unstable
+MONITOR_LOG_FLUSH_INTERVAL = 600 # Buffered log records are written at most this often
+MONITOR_TIMER_SLACK = 0.5 # Fraction of its interval a timer may be delayed to share a wakeup
+MONITOR_MAX_BACKOFF_AC = 4 # Max probe interval multiplier on mains power with a stable link
+MONITOR_MAX_BACKOFF_BATTERY = 20 # Same, on battery (30s -> 10 min)
+MONITOR_MAX_WAIT = 120 # Longest single sleep: a resume from suspend is noticed within this time
+MONITOR_RESUME_THRESHOLD = 10 # Seconds of wall-clock time unseen by the monotonic clock that mean a suspend
+
+# --- ATTEMPT HISTORY ---
+HISTORY_MAX_ROWS = 20000 # Older attempts are dropped by compaction
+HISTORY_COMPACT_EVERY = 500 # Inserts between compaction passes
 
 # --- OTHER ---
 DEFAULT_USERNAME_PLACEHOLDER = "username_not_set"
\ No newline at end of file
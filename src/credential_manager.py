@@ -3,6 +3,7 @@ import keyring
 import getpass
 import logging
 from constants import KEYRING_SERVICE_NAME, DEFAULT_USERNAME_PLACEHOLDER
+from tracing import span
 
 def save_credentials(username: str, password: str) -> bool:
     """Saves credentials to the OS keyring."""
@@ -25,7 +26,8 @@ def load_password(username: str) -> str | None:
         logging.warning("Attempted to load password for an invalid/unset username.")
         return None
     try:
-        password = keyring.get_password(KEYRING_SERVICE_NAME, username)
+        with span("keyring"):
+            password = keyring.get_password(KEYRING_SERVICE_NAME, username)
         if password:
             logging.info(f"Password loaded for user: {username}")
         else:
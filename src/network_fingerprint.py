@@ -0,0 +1,133 @@
+# network_fingerprint.py
+import os
+import socket
+import struct
+import hashlib
+import logging
+import configparser
+
+from constants import FINGERPRINT_FILE
+
+# Local sources describing the network we are attached to (Linux only;
+# on other platforms no fingerprint is produced and try_login probes as before).
+PROC_NET_ROUTE = "/proc/net/route"
+PROC_NET_ARP = "/proc/net/arp"
+RESOLV_CONF = "/etc/resolv.conf"
+
+FINGERPRINT_SECTION = 'Fingerprints'
+
+
+def _hex_to_ipv4(hex_le: str) -> str:
+    """Converts a little-endian hex address from /proc/net/route to dotted notation."""
+    return socket.inet_ntoa(struct.pack("<L", int(hex_le, 16)))
+
+
+def _read_default_route() -> tuple[str, str, str] | None:
+    """Returns (interface, gateway IP, interface subnet) for the default route, or None."""
+    try:
+        with open(PROC_NET_ROUTE) as route_file:
+            rows = [line.split() for line in route_file.readlines()[1:]]
+    except OSError:
+        return None
+
+    default = next((row for row in rows if len(row) >= 8 and row[1] == "00000000"), None)
+    if default is None:
+        return None
+    iface, gateway = default[0], _hex_to_ipv4(default[2])
+
+    subnet = ""
+    for row in rows:
+        # Directly connected network on the same interface (no gateway)
+        if len(row) >= 8 and row[0] == iface and row[1] != "00000000" and row[2] == "00000000":
+            prefix_len = bin(int(row[7], 16)).count("1")
+            subnet = f"{_hex_to_ipv4(row[1])}/{prefix_len}"
+            break
+    return iface, gateway, subnet
+
+
+def _read_gateway_mac(gateway: str) -> str:
+    """Looks up the gateway's MAC address in the ARP cache. Empty string if not cached."""
+    try:
+        with open(PROC_NET_ARP) as arp_file:
+            for line in arp_file.readlines()[1:]:
+                fields = line.split()
+                if len(fields) >= 4 and fields[0] == gateway:
+                    return fields[3].lower()
+    except OSError:
+        pass
+    return ""
+
+
+def _read_dhcp_domain() -> str:
+    """Returns the first search/domain entry of resolv.conf (normally pushed by DHCP)."""
+    try:
+        with open(RESOLV_CONF) as resolv_file:
+            for line in resolv_file:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] in ("search", "domain"):
+                    return fields[1].lower()
+    except OSError:
+        pass
+    return ""
+
+
+def get_current_fingerprint() -> str | None:
+    """
+    Builds a short fingerprint of the attached network from the default gateway
+    (IP and MAC), the interface subnet and the DHCP domain.
+    Returns None when no default route can be read.
+    """
+    route = _read_default_route()
+    if route is None:
+        return None
+    _, gateway, subnet = route
+    parts = (gateway, _read_gateway_mac(gateway), subnet, _read_dhcp_domain())
+    fingerprint = hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+    logging.info(f"Network fingerprint {fingerprint} (gateway {gateway}, subnet {subnet or '?'})")
+    return fingerprint
+
+
+def _load_fingerprints() -> configparser.ConfigParser:
+    fingerprints = configparser.ConfigParser()
+    if os.path.exists(FINGERPRINT_FILE):
+        fingerprints.read(FINGERPRINT_FILE)
+    if FINGERPRINT_SECTION not in fingerprints:
+        fingerprints[FINGERPRINT_SECTION] = {}
+    return fingerprints
+
+
+def lookup_location(fingerprint: str | None) -> str | None:
+    """Returns the location learned for this fingerprint, or None if unknown."""
+    if not fingerprint:
+        return None
+    return _load_fingerprints().get(FINGERPRINT_SECTION, fingerprint, fallback=None) or None
+
+
+def remember_location(fingerprint: str | None, location: str):
+    """Stores the fingerprint -> location mapping after a successful login (only written if changed)."""
+    if not fingerprint or not location:
+        return
+    fingerprints = _load_fingerprints()
+    if fingerprints[FINGERPRINT_SECTION].get(fingerprint) == location:
+        return
+    fingerprints[FINGERPRINT_SECTION][fingerprint] = location
+    try:
+        with open(FINGERPRINT_FILE, 'w') as fingerprint_file:
+            fingerprints.write(fingerprint_file)
+        logging.info(f"Network fingerprint {fingerprint} mapped to location '{location}'.")
+    except IOError as e:
+        logging.error(f"Error saving fingerprint file: {e}")
+
+
+def forget_fingerprint(fingerprint: str | None):
+    """Removes a mapping that turned out to be wrong (location no longer answering)."""
+    if not fingerprint:
+        return
+    fingerprints = _load_fingerprints()
+    if fingerprints.remove_option(FINGERPRINT_SECTION, fingerprint):
+        try:
+            with open(FINGERPRINT_FILE, 'w') as fingerprint_file:
+                fingerprints.write(fingerprint_file)
+            logging.info(f"Network fingerprint {fingerprint} forgotten.")
+        except IOError as e:
+            logging.error(f"Error saving fingerprint file: {e}")
@@ -4,25 +4,53 @@ import logging
 import platform
 import warnings
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Optional, Tuple
 
 from constants import (
     NETWORK_CHECK_TIMEOUT, 
     LOGIN_SERVER_REACH_TIMEOUT, 
     LOGIN_AUTH_TIMEOUT, 
+    LOGIN_VERIFY_POLL_DELAYS,
+    LOGIN_VERIFY_MAX_WAIT,
     LOGIN_SUCCESSFUL,
     REACHABLE_AUTH_FAILED_401, 
     REACHABLE_AUTH_OK_NO_INTERNET, 
     REACHABLE_POST_ERROR,
     NO_LOCATION_REACHABLE, 
     ALREADY_CONNECTED, 
-    MISSING_CREDENTIALS
+    MISSING_CREDENTIALS,
+    LOGIN_ABANDONED,
+    FANOUT_MAX_WORKERS
 )
+from tracing import span, collect_phases, add_phases
+import network_fingerprint
 
 
 # Suppress InsecureRequestWarning for unverified HTTPS requests
 warnings.simplefilter("ignore", category=requests.packages.urllib3.exceptions.InsecureRequestWarning)
 
+PORTAL_HEADERS = {
+    "Content-Type": "application/json",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36",
+    "Accept": "application/json, text/plain, */*",
+    "X-Snwl-Timer": "no-reset",
+    "X-Snwl-Api-Scope": "extended"
+}
+
+# Fragments of a SonicOS 401 body (lowercased) that point to a session still open
+# on the firewall, as opposed to wrong credentials.
+STALE_SESSION_MARKERS = (
+    "already logged",
+    "already authenticated",
+    "another session",
+    "session exists",
+    "session in use",
+    "override",
+    "preempt",
+)
+
 
 def check_internet_connection() -> bool:
     """
@@ -66,40 +94,166 @@ def check_internet_connection() -> bool:
     return False
 
 
+def wait_for_internet() -> bool:
+    """
+    Verifies the connection right after a successful login POST. The firewall may
+    take a moment to open the session, so failed checks are retried with the
+    LOGIN_VERIFY_POLL_DELAYS backoff until LOGIN_VERIFY_MAX_WAIT has passed.
+    """
+    deadline = time.monotonic() + LOGIN_VERIFY_MAX_WAIT
+    if check_internet_connection():
+        return True
+    for delay in LOGIN_VERIFY_POLL_DELAYS:
+        if time.monotonic() + delay > deadline:
+            break
+        time.sleep(delay)
+        if check_internet_connection():
+            return True
+    return False
+
+
+def is_stale_session_response(response: requests.Response) -> bool:
+    """Checks if a 401 from the auth endpoint reports a stuck server-side session."""
+    body = response.text.lower()
+    return any(marker in body for marker in STALE_SESSION_MARKERS)
+
+
+def teardown_stale_session(session: requests.Session, base_url: str,
+                           username: str, password: str) -> requests.Response:
+    """
+    Clears a stuck server-side session and re-authenticates on the same connection.
+    Sends DELETE /api/sonicos/auth, then the auth POST with override: true, which
+    preempts the old session even if the firewall refused the DELETE.
+    Returns the response of the re-authentication POST (request errors propagate).
+    """
+    login_url = f"{base_url}/api/sonicos/auth"
+    with span("teardown", base_url=base_url):
+        try:
+            logout_response = session.delete(
+                login_url, headers=PORTAL_HEADERS, auth=(username, password),
+                timeout=LOGIN_AUTH_TIMEOUT, verify=False
+            )
+            logging.info(f"Stale session DELETE at {base_url}: Status {logout_response.status_code}")
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Stale session DELETE failed at {base_url}: {e}. Relying on override.")
+
+        return session.post(
+            login_url, headers=PORTAL_HEADERS, auth=(username, password),
+            json={"override": True, "snwl": True}, timeout=LOGIN_AUTH_TIMEOUT, verify=False
+        )
+
+
+class LoginRace:
+    """
+    Shared by the attempts of one fan-out round. The first POST 200 claims the win;
+    other attempts that authenticate meanwhile wait for the claimant's internet check.
+    If it passes, the race is finished and they log out. If it fails, the claim is
+    released and one of the waiting attempts claims and verifies in turn.
+    Attempts that have not posted yet stop once the race is finished.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._claimed_by: Optional[str] = None
+        self.finished = threading.Event()
+
+    def claim(self, location: str) -> bool:
+        """Blocks while another location holds the claim. Returns False once the race is finished."""
+        with self._condition:
+            while self._claimed_by is not None and not self.finished.is_set():
+                self._condition.wait()
+            if self.finished.is_set():
+                return False
+            self._claimed_by = location
+            return True
+
+    def release(self, location: str):
+        """Gives up the claim held by location (no-op otherwise), waking a waiting attempt."""
+        with self._condition:
+            if self._claimed_by == location:
+                self._claimed_by = None
+                self._condition.notify_all()
+
+    def finish(self):
+        """Ends the race: waiting and later attempts log out or stop."""
+        with self._condition:
+            self.finished.set()
+            self._condition.notify_all()
+
+
+def logout(session: requests.Session, login_url: str, headers: dict,
+           username: str, password: str, location_name: str):
+    """Closes the session just opened at location_name (DELETE /api/sonicos/auth)."""
+    try:
+        response = session.delete(login_url, headers=headers, auth=(username, password),
+                                  timeout=LOGIN_AUTH_TIMEOUT, verify=False)
+        logging.info(f"Logout at {location_name}: Status {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Logout at {location_name} failed: {e}")
+
+
 def try_login(locations: Dict[str, str], username: str, password: str,
               color_success, color_error, color_warning, color_reset,
-              force: bool = False, specific_location_to_try: Optional[str] = None) -> Tuple[str, Optional[str]]:
+              force: bool = False, specific_location_to_try: Optional[str] = None,
+              quiet: bool = False, race: Optional[LoginRace] = None,
+              skip_internet_check: bool = False) -> Tuple[str, Optional[str]]:
     """
     Attempts to log in to the Praticelli network.
     If specific_location_to_try is provided, only that location (if in locations) will be attempted.
     Otherwise, iterates through locations until one is found reachable.
+    If quiet is True nothing is printed to the console (logging is unaffected).
+    skip_internet_check skips the initial "already connected" check when the caller
+    already knows the link is down; unlike force it never overrides a stale session.
+    When forced, a 401 caused by a stuck server-side session is cleared with
+    teardown_stale_session() instead of being returned.
+    With a fan-out race, the attempt returns LOGIN_ABANDONED (logging out if it already
+    authenticated) when another location won the race first.
 
     Returns a tuple: (status_code_string, location_name_if_applicable)
     """
+    with span("try_login", force=force, specific_location=specific_location_to_try), \
+         requests.Session() as session: # One session per attempt: probe, POST and teardown share the connection
+        return _try_login(session, locations, username, password,
+                          color_success, color_error, color_warning, color_reset,
+                          force, specific_location_to_try, quiet, race, skip_internet_check)
+
+
+def _silent_print(*args, **kwargs):
+    """Stand-in for print() when console output is suppressed."""
+    pass
+
+
+def _try_login(session: requests.Session, locations: Dict[str, str], username: str, password: str,
+               color_success, color_error, color_warning, color_reset,
+               force: bool, specific_location_to_try: Optional[str],
+               quiet: bool, race: Optional[LoginRace],
+               skip_internet_check: bool) -> Tuple[str, Optional[str]]:
+    """Body of try_login, kept separate so the whole attempt is traced as one span."""
+    say = _silent_print if quiet else print
     if not username or not password:
-        print(f"\n{color_error}Username o password non forniti.{color_reset}")
+        say(f"\n{color_error}Username o password non forniti.{color_reset}")
         logging.error("Login attempt with missing username or password.")
         return MISSING_CREDENTIALS, None
 
-    if not force and check_internet_connection():
-        print(f"\n{color_success}==================================={color_reset}")
-        print(f"{color_success}Risulti già connesso a Internet.{color_reset}")
-        print(f"{color_success}Usa 'f' per forzare un nuovo login.{color_reset}")
-        print(f"{color_success}==================================={color_reset}\n")
-        return ALREADY_CONNECTED, None
-
-    headers = { # ... (same headers) ...
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36",
-        "Accept": "application/json, text/plain, */*",
-        "X-Snwl-Timer": "no-reset",
-        "X-Snwl-Api-Scope": "extended"
-    }
+    if not force and not skip_internet_check:
+        with span("verify", phase="already_connected"):
+            already_connected = check_internet_connection()
+        if already_connected:
+            say(f"\n{color_success}==================================={color_reset}")
+            say(f"{color_success}Risulti già connesso a Internet.{color_reset}")
+            say(f"{color_success}Usa 'f' per forzare un nuovo login.{color_reset}")
+            say(f"{color_success}==================================={color_reset}\n")
+            return ALREADY_CONNECTED, None
+
+    headers = PORTAL_HEADERS
     auth_data = {"override": False, "snwl": True}
 
-    print(f"\n{color_success}===== Tentativo di Connessione ====={color_reset}")
+    say(f"\n{color_success}===== Tentativo di Connessione ====={color_reset}")
     logging.info(f"Starting login for user. Forced: {force}. Specific location: {specific_location_to_try}")
 
+    fingerprint = network_fingerprint.get_current_fingerprint()
+    fingerprint_location = None # Location known to serve this network: its GET probe is skipped
+
     locations_to_iterate = locations
     if specific_location_to_try and specific_location_to_try in locations:
         locations_to_iterate = {specific_location_to_try: locations[specific_location_to_try]}
@@ -107,75 +261,223 @@ def try_login(locations: Dict[str, str], username: str, password: str,
     elif specific_location_to_try:
         logging.warning(f"Specific location {specific_location_to_try} not found in locations list. Iterating all.")
 
+    if not specific_location_to_try:
+        known_location = network_fingerprint.lookup_location(fingerprint)
+        if known_location in locations:
+            fingerprint_location = known_location
+            locations_to_iterate = {known_location: locations[known_location],
+                                    **{name: url for name, url in locations.items() if name != known_location}}
+            logging.info(f"Fingerprint {fingerprint} is known: going straight to {known_location}.")
 
     for location_name, base_url in locations_to_iterate.items():
         login_url = f"{base_url}/api/sonicos/auth"
         check_reach_url = f"{base_url}/sonicui/7/login/"
 
-        print(f"Tentativo su {location_name} ({base_url})... ", end="")
-        logging.info(f"Attempting GET for reachability at {location_name} ({check_reach_url})")
-        
-        try:
-            # 1. Reachability check (GET)
-            response_reach = requests.get(check_reach_url, timeout=LOGIN_SERVER_REACH_TIMEOUT, verify=False)
-            if response_reach.status_code != 200:
-                print(f"{color_error}Server non raggiungibile (status GET: {response_reach.status_code}){color_reset}")
-                logging.warning(f"{location_name}: GET failed with status {response_reach.status_code}")
-                if specific_location_to_try: # If trying specific and it fails GET, then it's NO_LOCATION_REACHABLE overall
+        say(f"Tentativo su {location_name} ({base_url})... ", end="")
+        zero_probe = location_name == fingerprint_location
+
+        if zero_probe:
+            logging.info(f"Skipping GET probe for {location_name} (known from network fingerprint).")
+        else:
+            logging.info(f"Attempting GET for reachability at {location_name} ({check_reach_url})")
+            try:
+                # 1. Reachability check (GET)
+                with span("probe", location=location_name):
+                    response_reach = session.get(check_reach_url, timeout=LOGIN_SERVER_REACH_TIMEOUT, verify=False)
+                if response_reach.status_code != 200:
+                    say(f"{color_error}Server non raggiungibile (status GET: {response_reach.status_code}){color_reset}")
+                    logging.warning(f"{location_name}: GET failed with status {response_reach.status_code}")
+                    if specific_location_to_try: # If trying specific and it fails GET, then it's NO_LOCATION_REACHABLE overall
+                        return NO_LOCATION_REACHABLE, location_name
+                    continue # Try next location if iterating
+
+            except requests.exceptions.RequestException as e_get:
+                say(f"{color_error}Server non raggiungibile (errore GET: {type(e_get).__name__}){color_reset}")
+                logging.warning(f"{location_name}: GET failed: {e_get}")
+                if specific_location_to_try:
                     return NO_LOCATION_REACHABLE, location_name
                 continue # Try next location if iterating
 
-        except requests.exceptions.RequestException as e_get:
-            print(f"{color_error}Server non raggiungibile (errore GET: {type(e_get).__name__}){color_reset}")
-            logging.warning(f"{location_name}: GET failed: {e_get}")
-            if specific_location_to_try:
-                return NO_LOCATION_REACHABLE, location_name
-            continue # Try next location if iterating
-        
-        # If we reach here, GET for 'location_name' was successful. Now attempt POST.
-        logging.info(f"GET successful for {location_name}. Proceeding to POST auth.")
+            # If we reach here, GET for 'location_name' was successful. Now attempt POST.
+            logging.info(f"GET successful for {location_name}. Proceeding to POST auth.")
+
+        if race is not None and race.finished.is_set():
+            logging.info(f"Attempt at {location_name} abandoned before POST.")
+            return LOGIN_ABANDONED, location_name
+
         try:
-            auth_response = requests.post(
-                login_url, headers=headers, auth=(username, password),
-                json=auth_data, timeout=LOGIN_AUTH_TIMEOUT, verify=False
-            )
+            with span("post", location=location_name):
+                auth_response = session.post(
+                    login_url, headers=headers, auth=(username, password),
+                    json=auth_data, timeout=LOGIN_AUTH_TIMEOUT, verify=False
+                )
             logging.info(f"POST Response from {location_name}: Status {auth_response.status_code}, Body: {auth_response.text[:200]}")
 
+            if auth_response.status_code == 401 and force and is_stale_session_response(auth_response):
+                say(f"{color_warning}sessione bloccata, la chiudo e ripeto l'autenticazione... {color_reset}", end="")
+                logging.warning(f"Stale session detected at {location_name}. Tearing it down and re-authenticating.")
+                auth_response = teardown_stale_session(session, base_url, username, password)
+                logging.info(f"Re-auth POST Response from {location_name}: Status {auth_response.status_code}, Body: {auth_response.text[:200]}")
+
+            if zero_probe and auth_response.status_code not in (200, 401):
+                # Not the auth endpoint we expected: the fingerprint guess was wrong, probe the others
+                say(f"{color_error}Risposta inattesa (status POST: {auth_response.status_code}).{color_reset}")
+                logging.warning(f"Zero-probe POST at {location_name} returned {auth_response.status_code}. Falling back to probing.")
+                network_fingerprint.forget_fingerprint(fingerprint)
+                continue
+
+            if auth_response.status_code == 200 and race is not None and not race.claim(location_name):
+                # Another location won meanwhile: log out here so no second session is left open
+                logout(session, login_url, headers, username, password, location_name)
+                logging.info(f"Attempt at {location_name} abandoned after POST 200, session logged out.")
+                return LOGIN_ABANDONED, location_name
+
             if auth_response.status_code == 200:
-                print(f"{color_success}OK (200){color_reset}, verifico connessione internet effettiva... ", end="")
-                time.sleep(2)
-                if check_internet_connection():
-                    print(f"{color_success}CONNESSO!{color_reset}")
+                say(f"{color_success}OK (200){color_reset}, verifico connessione internet effettiva... ", end="")
+                with span("verify", location=location_name):
+                    internet_ok = wait_for_internet()
+                if internet_ok:
+                    if race is not None:
+                        race.finish()
+                    say(f"{color_success}CONNESSO!{color_reset}")
                     logging.info(f"Successfully logged in at {location_name}. Internet confirmed.")
-                    print(f"{color_success}==================================={color_reset}\n")
+                    network_fingerprint.remember_location(fingerprint, location_name)
+                    say(f"{color_success}==================================={color_reset}\n")
                     return LOGIN_SUCCESSFUL, location_name
                 else:
-                    print(f"{color_error}Login OK (200) ma NESSUNA connessione Internet rilevata dopo.{color_reset}")
+                    if race is not None:
+                        # Useless session: close it and let a waiting location's 200 verify instead
+                        logout(session, login_url, headers, username, password, location_name)
+                        race.release(location_name)
+                    say(f"{color_error}Login OK (200) ma NESSUNA connessione Internet rilevata dopo.{color_reset}")
                     logging.warning(f"Login at {location_name} (200) but internet check failed.")
                     return REACHABLE_AUTH_OK_NO_INTERNET, location_name
 
             elif auth_response.status_code == 401:
                 username_hint = username[:3] + '***' + username[-3:] if len(username) > 5 else username[:3] + '***'
-                print(f"{color_warning}Fallito (401 Unauthorized).{color_reset}")
-                print(f"{color_warning}  Possibili cause per l'utente '{username_hint}':{color_reset}")
-                print(f"{color_warning}    1. Credenziali effettivamente errate.{color_reset}")
-                print(f"{color_warning}    2. Sessione precedente attiva/bloccata sul server Praticelli.{color_reset}")
-                print(f"{color_warning}  Se le credenziali sono corrette, prova a forzare il login ('f') o attendi.{color_reset}")
+                say(f"{color_warning}Fallito (401 Unauthorized).{color_reset}")
+                say(f"{color_warning}  Possibili cause per l'utente '{username_hint}':{color_reset}")
+                say(f"{color_warning}    1. Credenziali effettivamente errate.{color_reset}")
+                say(f"{color_warning}    2. Sessione precedente attiva/bloccata sul server Praticelli.{color_reset}")
+                say(f"{color_warning}  Se le credenziali sono corrette, prova a forzare il login ('f') o attendi.{color_reset}")
                 logging.warning(f"Login failed at {location_name} for user: 401 Unauthorized.")
                 return REACHABLE_AUTH_FAILED_401, location_name # Crucially, return this status and location
             
             else: # Other non-200, non-401 POST errors
-                print(f"{color_error}Fallito (status POST: {auth_response.status_code}).{color_reset}")
+                say(f"{color_error}Fallito (status POST: {auth_response.status_code}).{color_reset}")
                 logging.warning(f"Login (POST) failed at {location_name}: Status {auth_response.status_code}")
                 return REACHABLE_POST_ERROR, location_name
 
         except requests.exceptions.RequestException as e_post: # Timeout, ConnectionError for POST
-            print(f"{color_error}Errore durante il login (POST {type(e_post).__name__}).{color_reset}")
+            if zero_probe:
+                # The fingerprint guess was wrong (or the firewall is down): fall back to probing the others
+                say(f"{color_error}Non raggiungibile ({type(e_post).__name__}).{color_reset}")
+                logging.warning(f"Zero-probe POST failed at {location_name}: {e_post}. Falling back to probing.")
+                network_fingerprint.forget_fingerprint(fingerprint)
+                continue
+            say(f"{color_error}Errore durante il login (POST {type(e_post).__name__}).{color_reset}")
             logging.warning(f"POST failed at {location_name}: {e_post}")
             return REACHABLE_POST_ERROR, location_name # Still, the location was reachable by GET
 
     # If loop finishes, it means no location's GET was successful (if iterating all)
-    print(f"\n{color_error}Nessuna sede sembra raggiungibile dopo aver provato tutte quelle configurate.{color_reset}")
-    print(f"{color_error}==================================={color_reset}\n")
+    say(f"\n{color_error}Nessuna sede sembra raggiungibile dopo aver provato tutte quelle configurate.{color_reset}")
+    say(f"{color_error}==================================={color_reset}\n")
     logging.warning("All locations iterated, none were reachable via GET.")
-    return NO_LOCATION_REACHABLE, None
\ No newline at end of file
+    return NO_LOCATION_REACHABLE, None
+
+
+# Preference among failed fan-out results (lower is closer to a working login)
+FANOUT_FAILURE_RANK = {
+    REACHABLE_AUTH_OK_NO_INTERNET: 0,
+    REACHABLE_AUTH_FAILED_401: 1,
+    REACHABLE_POST_ERROR: 2,
+    NO_LOCATION_REACHABLE: 3,
+    LOGIN_ABANDONED: 4,
+}
+
+
+def _fanout_attempt(race: LoginRace, location_name: str, *login_args) -> Tuple[str, dict]:
+    """One fan-out worker: a forced try_login on location_name. Returns (status, phases in ms)."""
+    with collect_phases() as phases: # Spans are per thread: collect them here for the caller
+        try:
+            status, _ = try_login(*login_args, force=True, specific_location_to_try=location_name,
+                                  quiet=True, race=race)
+        finally:
+            race.release(location_name) # Never leave the others waiting on a claim, even on errors
+    return status, phases
+
+
+def _worker_phases(phases: dict) -> dict:
+    """Phases of a fan-out worker minus its own try_login total (the fan-out span covers that)."""
+    return {name: ms for name, ms in phases.items() if name != "try_login"}
+
+
+def try_login_fanout(locations: Dict[str, str], username: str, password: str,
+                     color_success, color_error, color_warning, color_reset,
+                     quiet: bool = False) -> Tuple[str, Optional[str]]:
+    """
+    Forced login on every location concurrently. The first POST 200 that passes the
+    internet check wins (see LoginRace); every other authenticated attempt logs out.
+    Without a success, returns the most promising failure (earlier locations win ties).
+    The phases of the reported attempt are added to the caller's collect_phases() block.
+
+    Returns a tuple: (status_code_string, location_name_if_applicable)
+    """
+    say = _silent_print if quiet else print
+    if not username or not password:
+        say(f"\n{color_error}Username o password non forniti.{color_reset}")
+        logging.error("Fan-out login attempt with missing username or password.")
+        return MISSING_CREDENTIALS, None
+
+    say(f"\n{color_success}===== Tentativo Parallelo su {len(locations)} Sedi ====={color_reset}")
+    logging.info(f"Starting fan-out forced login on: {', '.join(locations)}")
+    race = LoginRace()
+    results = {} # location -> (status, phases)
+    winner = None
+
+    with span("try_login", fan_out=True):
+        executor = ThreadPoolExecutor(max_workers=min(FANOUT_MAX_WORKERS, len(locations)) or 1,
+                                      thread_name_prefix="fanout")
+        futures = {
+            executor.submit(_fanout_attempt, race, name, locations, username, password,
+                            color_success, color_error, color_warning, color_reset): name
+            for name in locations
+        }
+        try:
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    status, phases = future.result()
+                except Exception as e: # Never let one location break the others
+                    logging.error(f"Fan-out attempt at {name} raised: {e}", exc_info=True)
+                    status, phases = REACHABLE_POST_ERROR, {}
+                results[name] = (status, phases)
+                if status == LOGIN_SUCCESSFUL:
+                    winner = name
+                    break
+                if status != LOGIN_ABANDONED:
+                    say(f"  {name}: {color_warning}{status}{color_reset}")
+        finally:
+            race.finish()
+            # Attempts still in flight stop before their POST, or log out after it; don't block on them
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    if winner:
+        add_phases(_worker_phases(results[winner][1]))
+        say(f"  {winner}: {color_success}CONNESSO!{color_reset}")
+        say(f"{color_success}==================================={color_reset}\n")
+        logging.info(f"Fan-out login won by {winner}.")
+        return LOGIN_SUCCESSFUL, winner
+
+    order = list(locations)
+    best = min(results, key=lambda name: (FANOUT_FAILURE_RANK.get(results[name][0], len(FANOUT_FAILURE_RANK)), order.index(name)),
+               default=None)
+    best_status = results[best][0] if best else NO_LOCATION_REACHABLE
+    if best:
+        add_phases(_worker_phases(results[best][1]))
+    if best_status == NO_LOCATION_REACHABLE:
+        best = None # Same convention as try_login when nothing answered
+    say(f"{color_error}Nessuna sede ha completato il login.{color_reset}")
+    say(f"{color_error}==================================={color_reset}\n")
+    logging.warning(f"Fan-out login failed everywhere. Best result: {best_status} at {best}.")
+    return best_status, best
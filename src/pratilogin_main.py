@@ -1,10 +1,16 @@
 import os
 import sys
 import logging
+import logging.handlers
 import time # For main loop delays, etc.
+import json
+import queue
+import threading
 import argparse
 import configparser
 
+PROCESS_START = time.perf_counter() # Reference point for --once timings
+
 # --- Setup Colorama (should be among the first imports) ---
 try:
     from colorama import init, Fore, Style
@@ -40,10 +46,17 @@ try:
         NO_LOCATION_REACHABLE,
         ALREADY_CONNECTED,
         MISSING_CREDENTIALS,
+        MISSING_LOCATIONS,
+        EXIT_CODES,
+        EXIT_CODE_UNEXPECTED_ERROR,
 
         # fORCE RECONNECTION CONSTANTS
         MAX_FORCE_RETRIES,
-        FORCE_RETRY_DELAY
+        FORCE_RETRY_DELAY,
+
+        # Monitor mode
+        MONITOR_PROBE_INTERVAL,
+        MONITOR_LOG_FLUSH_INTERVAL
     )
 except ImportError:
     print(f"{ERROR_COLOR}FATAL: constants.py not found. Exiting.{RESET_COLOR}")
@@ -88,6 +101,10 @@ try:
     import config_manager
     import credential_manager
     import network_ops
+    import tracing
+    import attempt_history
+    import probes
+    import scheduler
 except ImportError as e:
     logging.critical(f"Failed to import a core module: {e}. Ensure all .py files are present.")
     print(f"{ERROR_COLOR}FATAL: Manca un file del programma ({e.name}.py). Uscita.{RESET_COLOR}")
@@ -160,31 +177,271 @@ def handle_credential_setup(config):
     return username, password
 
 
-def main():
+def order_locations_last_first(locations_map: dict, last_loc: str) -> dict:
+    """Returns a copy of locations_map with last_loc (if valid) moved to the front."""
+    ordered_locations = {}
+    if last_loc and last_loc in locations_map:
+        ordered_locations[last_loc] = locations_map[last_loc]
+    for loc, url in locations_map.items():
+        if loc != last_loc:
+            ordered_locations[loc] = url
+    return ordered_locations
+
+
+def attempt_login(locations: dict, username: str, password: str, retries: int = 0,
+                  fan_out: bool = False, **login_options):
+    """
+    Runs network_ops.try_login (or try_login_fanout if fan_out) with the console colors
+    and appends the attempt, with its per-phase timings, to the attempt history.
+    retries is the number of earlier attempts in the same forced sequence.
+    """
+    login_func = network_ops.try_login_fanout if fan_out else network_ops.try_login
+    with tracing.collect_phases() as phases:
+        status, loc_name = login_func(
+            locations, username, password,
+            SUCCESS_COLOR, ERROR_COLOR, WARNING_COLOR, RESET_COLOR,
+            **login_options
+        )
+    attempt_history.record_attempt(status, loc_name, retries, phases)
+    return status, loc_name
+
+
+def _format_ms(value: float | None) -> str:
+    return f"{value / 1000:.2f}s" if value is not None else "-"
+
+
+def print_stats_report() -> int:
+    """Prints success rate, time-to-connect percentiles and worst outages from the attempt history."""
+    stats = attempt_history.compute_stats()
+    if stats is None:
+        print(f"{WARNING_COLOR}Nessun tentativo registrato finora.{RESET_COLOR}")
+        return 0
+
+    first = time.strftime('%Y-%m-%d %H:%M', time.localtime(stats['first']))
+    last = time.strftime('%Y-%m-%d %H:%M', time.localtime(stats['last']))
+    print(f"\n{INFO_COLOR}===== Statistiche PratiLogin ====={RESET_COLOR}")
+    print(f"{stats['attempts']} tentativi registrati dal {first} al {last}")
+    print("Il successo è calcolato sui soli login: i controlli con esito 'già connesso' sono esclusi.")
+
+    for title, key, label in (("Per sede", 'by_location', "{}"), ("Per ora del giorno", 'by_hour', "{:02d}:00")):
+        print(f"\n{INFO_COLOR}{title}{RESET_COLOR}")
+        print(f"  {'':<10} {'tentativi':>9} {'successo':>9} {'p50':>8} {'p95':>8}")
+        for row in stats[key]:
+            name = label.format(row['group']) if row['group'] is not None else "(nessuna)"
+            success_rate = f"{row['success_rate']:.0%}" if row['success_rate'] is not None else "-"
+            print(f"  {name:<10} {row['attempts']:>9} {success_rate:>9} "
+                  f"{_format_ms(row['p50_ms']):>8} {_format_ms(row['p95_ms']):>8}")
+
+    print(f"\n{INFO_COLOR}Disservizi più lunghi{RESET_COLOR}")
+    if not stats['worst_outages']:
+        print("  Nessuno.")
+    for outage in stats['worst_outages']:
+        start = time.strftime('%Y-%m-%d %H:%M', time.localtime(outage['start']))
+        print(f"  {start}  durata {outage['duration_s'] / 60:.1f} min, {outage['failed_attempts']} tentativi falliti")
+    print()
+    return 0
+
+
+def load_unattended():
+    """
+    Loads config, credentials and locations without ever prompting.
+    Returns (config, username, password, locations_map, error_status) where
+    error_status is MISSING_CREDENTIALS, MISSING_LOCATIONS or None.
+    """
+    with tracing.span("config"):
+        config, _ = config_manager.load_config()
+
+    username = config_manager.get_username_from_config(config)
+    password = None
+    if username != DEFAULT_USERNAME_PLACEHOLDER:
+        password = credential_manager.load_password(username)
+
+    locations_map = config_manager.get_locations(config)
+    error_status = None
+    if not password:
+        error_status = MISSING_CREDENTIALS
+        logging.error("Unattended mode: credentials not available, run interactively to set them up.")
+    elif not locations_map:
+        error_status = MISSING_LOCATIONS
+        logging.error("Unattended mode: no locations found in config.")
+    return config, username, password, locations_map, error_status
+
+
+def run_once(force: bool, emit_json: bool, fan_out: bool = False) -> int:
+    """
+    Non-interactive single login attempt for dispatcher hooks and system services.
+    Never prompts or prints (except the optional JSON result). Returns the process exit code.
+    With fan_out (forced only), all locations are tried concurrently.
+    """
+    loc_name = None
+    with tracing.collect_phases() as phases:
+        config, username, password, locations_map, status = load_unattended()
+    timings = {'config_ms': phases.get('config', 0.0), 'credentials_ms': phases.get('keyring', 0.0)}
+
+    if status is None:
+        ordered_locations = order_locations_last_first(locations_map, config_manager.get_last_location(config))
+        phase_start = time.perf_counter()
+        if fan_out:
+            status, loc_name = attempt_login(ordered_locations, username, password, fan_out=True, quiet=True)
+        else:
+            status, loc_name = attempt_login(
+                ordered_locations, username, password,
+                force=force, quiet=True
+            )
+        timings['login_ms'] = (time.perf_counter() - phase_start) * 1000
+        if loc_name and loc_name != config_manager.get_last_location(config):
+            config_manager.update_last_location(config, loc_name)
+
+    exit_code = EXIT_CODES.get(status, EXIT_CODE_UNEXPECTED_ERROR)
+    timings['total_ms'] = (time.perf_counter() - PROCESS_START) * 1000
+    logging.info(f"--once finished: status {status}, location {loc_name}, exit code {exit_code}")
+
+    if emit_json:
+        print(json.dumps({
+            "status": status,
+            "location": loc_name,
+            "exit_code": exit_code,
+            "forced": force,
+            "fan_out": fan_out,
+            "timings_ms": {phase: round(ms, 1) for phase, ms in timings.items()},
+        }))
+    return exit_code
+
+
+def buffer_file_logging() -> logging.handlers.MemoryHandler | None:
+    """
+    Puts a MemoryHandler in front of the log file so records are written in batches
+    (on flush, when the buffer fills up, or immediately for errors).
+    """
+    root_logger = logging.getLogger()
+    file_handler = next((h for h in root_logger.handlers if isinstance(h, logging.FileHandler)), None)
+    if file_handler is None:
+        return None
+    log_buffer = logging.handlers.MemoryHandler(capacity=1000, flushLevel=logging.ERROR, target=file_handler)
+    root_logger.removeHandler(file_handler)
+    root_logger.addHandler(log_buffer)
+    return log_buffer
+
+
+def print_async(message: str):
+    """Prints output not triggered by the user; if the menu prompt is waiting, redraws it below."""
+    print(message)
+    if prompt_visible.is_set():
+        print(MENU_PROMPT, end="", flush=True)
+
+
+def reconnect_if_offline(config, locations_map: dict, username: str, password: str) -> bool:
+    """
+    Background connectivity check with the cheap probes; logs in again if offline.
+    Prints a one-line status update only when it acts. Returns True if the state is
+    stable: the link was up, or no campus location answered (off campus), so the
+    scheduler backs off instead of retrying a full login at the base interval.
+    """
+    last_loc = config_manager.get_last_location(config)
+    online, backend = probes.probe_connectivity()
+    if online:
+        return True
+    logging.warning(f"Monitor: connection lost (decided by '{backend}' probe). Logging in again.")
+    # Already known offline: skip the redundant internet check, but never force (no session override)
+    status, loc_name = attempt_login(
+        order_locations_last_first(locations_map, last_loc), username, password,
+        skip_internet_check=True, quiet=True
+    )
+    if loc_name and loc_name != last_loc:
+        config_manager.update_last_location(config, loc_name)
+    color = SUCCESS_COLOR if status == LOGIN_SUCCESSFUL else WARNING_COLOR
+    print_async(f"\n{color}[{time.strftime('%H:%M:%S')}] Connessione persa, nuovo login: {status} ({loc_name or '-'}){RESET_COLOR}")
+    return status == NO_LOCATION_REACHABLE
+
+
+def run_monitor() -> int:
+    """
+    Unattended power-saving monitor: checks connectivity with the cheap probes and
+    logs in again when the link drops. All timers share one CoalescingScheduler,
+    and the probe interval backs off while the link is stable (more on battery).
+    """
+    config, username, password, locations_map, error_status = load_unattended()
+    if error_status:
+        print(f"{ERROR_COLOR}Impossibile avviare il monitor ({error_status}). Avvia PratiLogin in modalità interattiva.{RESET_COLOR}")
+        return EXIT_CODES[error_status]
+
+    log_buffer = buffer_file_logging()
+    monitor = scheduler.CoalescingScheduler()
+    monitor.add_task(
+        "probe",
+        lambda: reconnect_if_offline(config, locations_map, username, password),
+        MONITOR_PROBE_INTERVAL, adaptive=True, run_now=True
+    )
+    if log_buffer:
+        monitor.add_task("log_flush", log_buffer.flush, MONITOR_LOG_FLUSH_INTERVAL, slack=1.0)
+
+    print(f"{INFO_COLOR}Monitor attivo: la connessione viene controllata in background. Ctrl+C per uscire.{RESET_COLOR}")
+    logging.info("Monitor mode started.")
+    try:
+        monitor.run_forever()
+    finally:
+        logging.info(f"Monitor mode stopped after {monitor.wakeups} wakeups.")
+        if log_buffer:
+            log_buffer.flush()
+    return 0
+
+
+def main() -> int:
     parser = argparse.ArgumentParser(description="Fast PratiLogin Application")
     parser.add_argument(
         "--clear-credentials",
         action="store_true",
         help="Rimuove le credenziali salvate per l'utente configurato ed esce."
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Esegue la sessione sotto profiler e salva statistiche e timeline dei login nella cartella dell'app."
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Esegue un solo tentativo di login senza interazione ed esce con un codice che indica l'esito."
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Con --once: forza il login anche se risulta già una connessione Internet."
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Con --once: stampa l'esito e i tempi in formato JSON."
+    )
+    parser.add_argument(
+        "--fan-out",
+        action="store_true",
+        help="Nel login forzato ('f' o --once --force) prova tutte le sedi in parallelo e tiene la prima che riesce."
+    )
+    parser.add_argument(
+        "--monitor",
+        action="store_true",
+        help="Controlla la connessione in background (a basso consumo) e rifà il login quando cade."
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Mostra le statistiche dei tentativi di login registrati ed esce."
+    )
     args = parser.parse_args()
+    if (args.force or args.json) and not args.once:
+        parser.error("--force e --json richiedono --once")
+    if args.fan_out and args.once and not args.force:
+        parser.error("--fan-out con --once richiede --force")
 
-    # Carica la configurazione per ottenere lo username
-    # Definisci i percorsi effettivi PRIMA di setup_logging o caricare config
-    # Questa logica dovrebbe essere unificata in futuro
-    effective_app_dir = os.path.join(os.getenv('APPDATA'), "Fast_Pratilogin") # Default
-    
-    effective_config_file = os.path.join(effective_app_dir, "config.ini")
-    # Non inizializzare il logging completo se stiamo solo pulendo le credenziali
-    
     if args.clear_credentials:
         print(f"{INFO_COLOR}Tentativo di rimozione credenziali...{RESET_COLOR}")
         try:
             # Carica config solo per leggere lo username, non serve il setup completo del logging
             # o la gestione della prima esecuzione qui.
             temp_config = configparser.ConfigParser()
-            if os.path.exists(effective_config_file):
-                temp_config.read(effective_config_file)
+            if os.path.exists(CONFIG_FILE):
+                temp_config.read(CONFIG_FILE)
                 username_to_clear = temp_config.get('GeneralSettings', 'Username', fallback=None)
                 
                 if username_to_clear and username_to_clear != DEFAULT_USERNAME_PLACEHOLDER:
@@ -204,13 +461,203 @@ def main():
         finally:
             sys.exit(0) # Esce dopo aver tentato la pulizia
 
+    if args.stats:
+        return print_stats_report()
+
+    if args.monitor:
+        if args.profile:
+            return tracing.run_profiled(run_monitor)
+        return run_monitor()
+
+    if args.once:
+        if args.profile:
+            return tracing.run_profiled(run_once, args.force, args.json, args.fan_out)
+        return run_once(args.force, args.json, args.fan_out)
+
+    if args.profile:
+        tracing.run_profiled(run_session, args.fan_out)
+    else:
+        run_session(args.fan_out)
+    return 0
+
+
+QUIT_COMMANDS = ['c', 'q', 'chiudi']
+
+ACTIONS_MENU = f"\n{INFO_COLOR}Azioni: [R]iprova/Stato, [F]orza login, [L]ogin cambia, [O]pen folder, [H]elp, [C]hiudi{RESET_COLOR}"
+MENU_PROMPT = "Scegli un'opzione: "
+prompt_visible = threading.Event() # Set while the input reader waits at MENU_PROMPT
+
+
+def read_commands(commands: queue.Queue, prompt_ready: threading.Event):
+    """
+    Reader thread: owns stdin and queues (command, payload) tuples for the main thread.
+    The credential prompt for 'l' also runs here, so the main thread never blocks on input.
+    """
+    while True:
+        prompt_ready.wait()
+        prompt_ready.clear()
+        print(ACTIONS_MENU)
+        try:
+            prompt_visible.set()
+            user_input = input(MENU_PROMPT).lower().strip()
+        except EOFError: # stdin closed
+            user_input = 'c'
+        finally:
+            prompt_visible.clear()
+
+        payload = None
+        if user_input in ['l', 'login']:
+            print(f"\n{INFO_COLOR}--- Cambio Credenziali ---{RESET_COLOR}")
+            payload = credential_manager.prompt_for_credentials()
+        commands.put((user_input, payload))
+        if user_input in QUIT_COMMANDS:
+            return
+
+
+def run_login_check(config, locations_map: dict, username: str, password: str):
+    """Normal login attempt ('r'): verifies the connection and logs in if needed."""
+    print(f"\n{INFO_COLOR}Verifica connessione / Tentativo di login... (Premi 'h' per aiuto){RESET_COLOR}")
+
+    # Build current_ordered_locations with the current last location first
+    current_ordered_locations = order_locations_last_first(
+        locations_map, config_manager.get_last_location(config)
+    )
+
+    # Normal attempt - tries ordered_locations, specific_location_to_try is None initially
+    status, loc_name = attempt_login(
+        current_ordered_locations, username, password,
+        force=False
+    )
+
+    if loc_name: # A location was at least targeted and GET attempted
+        config_manager.update_last_location(config, loc_name)
+
+    if status == NO_LOCATION_REACHABLE:
+        print(f"{ERROR_COLOR}Nessun blocco del campus sembra raggiungibile al momento.{RESET_COLOR}")
+    # Other statuses have messages in try_login
+
+
+def change_credentials(config, new_username_input: str | None, new_password_input: str | None) -> bool:
+    """Stores credentials entered with 'l'. Returns True if the new credentials are active."""
+    if not (new_username_input and new_password_input):
+        print("Cambio credenziali annullato.")
+        return False
+
+    old_username = config_manager.get_username_from_config(config)
+    # Delete old credentials if username changed or if it's good practice
+    if old_username and old_username != DEFAULT_USERNAME_PLACEHOLDER and old_username != new_username_input:
+        credential_manager.delete_credentials(old_username) # Delete for old user
+
+    if credential_manager.save_credentials(new_username_input, new_password_input):
+        config_manager.store_username_in_config(config, new_username_input)
+        print(f"{SUCCESS_COLOR}Credenziali aggiornate per {new_username_input}.{RESET_COLOR}")
+        logging.info(f"Credentials updated for user.")
+        return True
+
+    print(f"{ERROR_COLOR}Salvataggio nuove credenziali fallito.{RESET_COLOR}")
+    logging.error("Failed to save new credentials during change.")
+    return False
+
+
+def run_forced_login(config, locations_map: dict, username: str, password: str, fan_out: bool):
+    """Forced login ('f'): serial retries on the last location, or one concurrent round if fan_out."""
+    print(f"\n{INFO_COLOR}--- Modalità Login Forzato ---{RESET_COLOR}") # Changed title for clarity
+    if fan_out:
+        # One concurrent round on every location replaces the serial retries on a single one
+        status, loc_name = attempt_login(
+            order_locations_last_first(locations_map, config_manager.get_last_location(config)),
+            username, password, fan_out=True
+        )
+        if loc_name:
+            config_manager.update_last_location(config, loc_name)
+        if status == LOGIN_SUCCESSFUL:
+            print(f"{SUCCESS_COLOR}Login forzato riuscito su '{loc_name}'!{RESET_COLOR}")
+        else:
+            print(f"{ERROR_COLOR}Modalità login forzato terminata senza successo ({status}).{RESET_COLOR}")
+        return
+
+    force_location_target = config_manager.get_last_location(config)
+
+    if not force_location_target or force_location_target not in locations_map:
+        print(f"{INFO_COLOR}Nessuna ultima location valida, cerco una sede raggiungibile...{RESET_COLOR}")
+        # When finding an initial target, iterate all locations
+        status_find, found_loc = attempt_login(
+            locations_map, username, password,
+            force=True, specific_location_to_try=None # Iterate all
+        )
+        if found_loc:
+            config_manager.update_last_location(config, found_loc) # Save if found
+            force_location_target = found_loc # This is now our target
+        # If status_find is NO_LOCATION_REACHABLE or found_loc is None, error printed below
+
+    if not force_location_target: # Check again after trying to find one
+        print(f"{ERROR_COLOR}Impossibile determinare una sede per forzare il login.{RESET_COLOR}")
+        return
+
+    print(f"{INFO_COLOR}Tenterò di forzare il login su '{force_location_target}' fino a {MAX_FORCE_RETRIES} volte.{RESET_COLOR}")
+    retries = 0
+    force_success = False
+    while retries < MAX_FORCE_RETRIES:
+        retries += 1
+        print(f"{INFO_COLOR}Tentativo forzato {retries}/{MAX_FORCE_RETRIES} su '{force_location_target}'...{RESET_COLOR}")
+
+        # In the force loop, ALWAYS try the specific force_location_target
+        # The try_login function itself handles if this target becomes unreachable
+        current_status, current_loc_name = attempt_login( # <-- GET TUPLE HERE
+            locations_map, username, password,
+            force=True, specific_location_to_try=force_location_target,
+            retries=retries - 1
+        )
+
+        # current_loc_name from try_login will be force_location_target if it was attempted,
+        # or None if something went wrong before even trying (e.g. MISSING_CREDENTIALS)
+        # or if specific_location_to_try was not in locations_map (shouldn't happen here)
+        if current_loc_name:
+            config_manager.update_last_location(config, current_loc_name)
+            # It's possible try_login iterated if specific_location_to_try was initially bad,
+            # so update force_location_target to what was actually last attempted.
+            force_location_target = current_loc_name
+
+
+        if current_status == LOGIN_SUCCESSFUL:
+            print(f"{SUCCESS_COLOR}Login forzato riuscito su '{current_loc_name}'!{RESET_COLOR}")
+            force_success = True
+            break
+        elif current_status == NO_LOCATION_REACHABLE:
+            # This means the specific_location_to_try (force_location_target) became unreachable
+            print(f"{ERROR_COLOR}'{force_location_target}' non è più raggiungibile. Interrompo i tentativi forzati.{RESET_COLOR}")
+            break
+        elif current_status in [REACHABLE_AUTH_FAILED_401, REACHABLE_AUTH_OK_NO_INTERNET, REACHABLE_POST_ERROR]:
+            if retries < MAX_FORCE_RETRIES:
+                print(f"{WARNING_COLOR}Login su '{force_location_target}' non completato (stato: {current_status}). Riprovo tra {FORCE_RETRY_DELAY} sec...{RESET_COLOR}")
+                time.sleep(FORCE_RETRY_DELAY)
+            else:
+                print(f"{ERROR_COLOR}Numero massimo di tentativi forzati raggiunto per '{force_location_target}'. Login fallito.{RESET_COLOR}")
+        elif current_status == ALREADY_CONNECTED:
+            print(f"{SUCCESS_COLOR}Risulta già connesso durante il tentativo forzato.{RESET_COLOR}")
+            force_success = True
+            break
+        else: # MISSING_CREDENTIALS or other unexpected
+            print(f"{ERROR_COLOR}Errore ({current_status}) durante il login forzato. Interrompo.{RESET_COLOR}")
+            break
+
+    if not force_success:
+        print(f"{ERROR_COLOR}Modalità login forzato terminata senza successo.{RESET_COLOR}")
+
+
+def run_session(fan_out: bool = False):
+    """
+    Runs the interactive login session: config, credentials, then the main command loop.
+    With fan_out, forced logins ('f') try all locations concurrently.
+    """
     system_ops.ensure_app_dir_exists() # Basato su APP_DIR da constants
     setup_logging() # Basato su LOG_FILE da constants
 
     print_title()
     logging.info("Main function started.")
 
-    config, is_first_run_logic = config_manager.load_config()
+    with tracing.span("config"):
+        config, is_first_run_logic = config_manager.load_config()
     logging.info(f"Config loaded. Is first run (logic based): {is_first_run_logic}")
 
     username, password = handle_credential_setup(config)
@@ -229,19 +676,13 @@ def main():
         sys.exit(1)
 
     # Order locations: try last connected one first
-    ordered_locations = {}
-    last_loc = config_manager.get_last_location(config)
-    if last_loc and last_loc in locations_map:
-        ordered_locations[last_loc] = locations_map[last_loc]
-    for loc, url in locations_map.items():
-        if loc != last_loc:
-            ordered_locations[loc] = url
+    ordered_locations = order_locations_last_first(locations_map, config_manager.get_last_location(config))
 
     if is_first_run_logic:
         print(f"\n{INFO_COLOR}Primo avvio: Tento la connessione automaticamente...{RESET_COLOR}")
-        status, loc_name = network_ops.try_login(
+        status, loc_name = attempt_login(
             ordered_locations, username, password,
-            SUCCESS_COLOR, ERROR_COLOR, WARNING_COLOR, RESET_COLOR, force=True
+            force=True
         )
         if loc_name: # If a location was attempted (even if failed post)
             config_manager.update_last_location(config, loc_name)
@@ -249,182 +690,70 @@ def main():
             print(f"{SUCCESS_COLOR}Connesso a {loc_name} e salvato come ultima location.{RESET_COLOR}")
         # Other statuses already print messages within try_login
 
-    skip_next_auto_login = False
-
-    while True:
-        if not skip_next_auto_login:
-            print(f"\n{INFO_COLOR}Verifica connessione / Tentativo di login... (Premi 'h' per aiuto){RESET_COLOR}")
-
-            current_last_loc_name = config_manager.get_last_location(config)
-            loc_to_try_first = None
-            # Build current_ordered_locations with current_last_loc_name first
-            current_ordered_locations = {}
-            if current_last_loc_name and current_last_loc_name in locations_map:
-                loc_to_try_first = current_last_loc_name
-                current_ordered_locations[current_last_loc_name] = locations_map[current_last_loc_name]
-            for l_key, l_url in locations_map.items():
-                if l_key != current_last_loc_name:
-                    current_ordered_locations[l_key] = l_url
-
-            # Normal attempt - tries ordered_locations, specific_location_to_try is None initially
-            status, loc_name = network_ops.try_login(
-                current_ordered_locations, username, password,
-                SUCCESS_COLOR, ERROR_COLOR, WARNING_COLOR, RESET_COLOR, force=False
-            )
-
-            if loc_name: # A location was at least targeted and GET attempted
-                config_manager.update_last_location(config, loc_name)
-
-            if status == LOGIN_SUCCESSFUL:
-                pass # Message already printed
-            elif status == ALREADY_CONNECTED:
-                pass # Message already printed
-            elif status == REACHABLE_AUTH_FAILED_401:
-                # Message in try_login is quite descriptive.
-                # Main loop doesn't need to do much more here for a normal attempt.
-                pass
-            elif status == NO_LOCATION_REACHABLE:
-                print(f"{ERROR_COLOR}Nessun blocco del campus sembra raggiungibile al momento.{RESET_COLOR}")
-            # Other statuses have messages in try_login
+    running = True
+    commands = queue.Queue()
+    prompt_ready = threading.Event() # Set when the reader may show the menu again
+    threading.Thread(target=read_commands, args=(commands, prompt_ready), name="input-reader", daemon=True).start()
 
-        skip_next_auto_login = False
-
-        print(f"\n{INFO_COLOR}Azioni: [R]iprova/Stato, [F]orza login, [L]ogin cambia, [O]pen folder, [H]elp, [C]hiudi{RESET_COLOR}")
-        user_input = input("Scegli un'opzione: ").lower().strip()
+    def wait_for_command(timeout: float):
+        """Scheduler wait: sleeps until the next timer, handling user commands as they arrive."""
+        nonlocal username, password, running
+        if system_ops.is_windows():
+            timeout = min(timeout, 1.0) # Lock waits are not interrupted by Ctrl+C on Windows
+        try:
+            user_input, payload = commands.get(timeout=timeout)
+        except queue.Empty:
+            return
 
-        if user_input in ['c', 'q', 'chiudi']:
+        if user_input in QUIT_COMMANDS:
             logging.info("User chose to exit.")
-            break
+            running = False
+            return # Reader thread has stopped: don't release the prompt
         elif user_input in ['l', 'login']:
-            print(f"\n{INFO_COLOR}--- Cambio Credenziali ---{RESET_COLOR}")
-            old_username = config_manager.get_username_from_config(config)
-
-            new_username_input, new_password_input = credential_manager.prompt_for_credentials()
-
-            if new_username_input and new_password_input:
-                # Delete old credentials if username changed or if it's good practice
-                if old_username and old_username != DEFAULT_USERNAME_PLACEHOLDER and old_username != new_username_input:
-                    credential_manager.delete_credentials(old_username) # Delete for old user
-
-                if credential_manager.save_credentials(new_username_input, new_password_input):
-                    username = new_username_input # Update active username
-                    password = new_password_input # Update active password
-                    config_manager.store_username_in_config(config, username)
-                    print(f"{SUCCESS_COLOR}Credenziali aggiornate per {username}.{RESET_COLOR}")
-                    logging.info(f"Credentials updated for user.")
-                    print("Riprovo la connessione con le nuove credenziali...")
-                    skip_next_auto_login = False # Force a login attempt
-                else:
-                    print(f"{ERROR_COLOR}Salvataggio nuove credenziali fallito.{RESET_COLOR}")
-                    logging.error("Failed to save new credentials during change.")
-                    skip_next_auto_login = True # Don't try with potentially bad state
-            else:
-                print("Cambio credenziali annullato.")
-                skip_next_auto_login = True
-
-        # For 'f' (force login):
+            new_username_input, new_password_input = payload
+            if change_credentials(config, new_username_input, new_password_input):
+                username, password = new_username_input, new_password_input
+                print("Riprovo la connessione con le nuove credenziali...")
+                run_login_check(config, locations_map, username, password)
         elif user_input == 'f':
-            print(f"\n{INFO_COLOR}--- Modalità Login Forzato ---{RESET_COLOR}") # Changed title for clarity
-            force_location_target = config_manager.get_last_location(config)
-
-            if not force_location_target or force_location_target not in locations_map:
-                print(f"{INFO_COLOR}Nessuna ultima location valida, cerco una sede raggiungibile...{RESET_COLOR}")
-                # When finding an initial target, iterate all locations
-                status_find, found_loc = network_ops.try_login(
-                    locations_map, username, password,
-                    SUCCESS_COLOR, ERROR_COLOR, WARNING_COLOR, RESET_COLOR,
-                    force=True, specific_location_to_try=None # Iterate all
-                )
-                if found_loc:
-                    config_manager.update_last_location(config, found_loc) # Save if found
-                    force_location_target = found_loc # This is now our target
-                # If status_find is NO_LOCATION_REACHABLE or found_loc is None, error printed below
-
-            if not force_location_target: # Check again after trying to find one
-                 print(f"{ERROR_COLOR}Impossibile determinare una sede per forzare il login.{RESET_COLOR}")
-                 skip_next_auto_login = True
-                 continue # Go back to main loop prompt
-
-            print(f"{INFO_COLOR}Tenterò di forzare il login su '{force_location_target}' fino a {MAX_FORCE_RETRIES} volte.{RESET_COLOR}")
-            retries = 0
-            force_success = False
-            while retries < MAX_FORCE_RETRIES:
-                retries += 1
-                print(f"{INFO_COLOR}Tentativo forzato {retries}/{MAX_FORCE_RETRIES} su '{force_location_target}'...{RESET_COLOR}")
-
-                # In the force loop, ALWAYS try the specific force_location_target
-                # The try_login function itself handles if this target becomes unreachable
-                current_status, current_loc_name = network_ops.try_login( # <-- GET TUPLE HERE
-                    locations_map, username, password,
-                    SUCCESS_COLOR, ERROR_COLOR, WARNING_COLOR, RESET_COLOR,
-                    force=True, specific_location_to_try=force_location_target
-                )
-
-                # current_loc_name from try_login will be force_location_target if it was attempted,
-                # or None if something went wrong before even trying (e.g. MISSING_CREDENTIALS)
-                # or if specific_location_to_try was not in locations_map (shouldn't happen here)
-                if current_loc_name:
-                    config_manager.update_last_location(config, current_loc_name)
-                    # It's possible try_login iterated if specific_location_to_try was initially bad,
-                    # so update force_location_target to what was actually last attempted.
-                    force_location_target = current_loc_name
-
-
-                if current_status == LOGIN_SUCCESSFUL:
-                    print(f"{SUCCESS_COLOR}Login forzato riuscito su '{current_loc_name}'!{RESET_COLOR}")
-                    force_success = True
-                    break
-                elif current_status == NO_LOCATION_REACHABLE:
-                    # This means the specific_location_to_try (force_location_target) became unreachable
-                    print(f"{ERROR_COLOR}'{force_location_target}' non è più raggiungibile. Interrompo i tentativi forzati.{RESET_COLOR}")
-                    break
-                elif current_status in [REACHABLE_AUTH_FAILED_401, REACHABLE_AUTH_OK_NO_INTERNET, REACHABLE_POST_ERROR]:
-                    if retries < MAX_FORCE_RETRIES:
-                        print(f"{WARNING_COLOR}Login su '{force_location_target}' non completato (stato: {current_status}). Riprovo tra {FORCE_RETRY_DELAY} sec...{RESET_COLOR}")
-                        time.sleep(FORCE_RETRY_DELAY)
-                    else:
-                        print(f"{ERROR_COLOR}Numero massimo di tentativi forzati raggiunto per '{force_location_target}'. Login fallito.{RESET_COLOR}")
-                elif current_status == ALREADY_CONNECTED:
-                    print(f"{SUCCESS_COLOR}Risulta già connesso durante il tentativo forzato.{RESET_COLOR}")
-                    force_success = True
-                    break
-                else: # MISSING_CREDENTIALS or other unexpected
-                    print(f"{ERROR_COLOR}Errore ({current_status}) durante il login forzato. Interrompo.{RESET_COLOR}")
-                    break
-
-            if not force_success:
-                print(f"{ERROR_COLOR}Modalità login forzato terminata senza successo.{RESET_COLOR}")
-            skip_next_auto_login = True
-
+            run_forced_login(config, locations_map, username, password, fan_out)
         elif user_input in ['r', 'riprova', '']: # Enter also retries
-            skip_next_auto_login = False # Will trigger the auto-login attempt at loop start
-
+            run_login_check(config, locations_map, username, password)
         elif user_input == 'h':
             print_help()
-            skip_next_auto_login = True
-
         elif user_input == 'o':
             system_ops.open_app_data_folder()
-            skip_next_auto_login = True
-
         else:
             print(f"{WARNING_COLOR}Comando non riconosciuto. Premi 'h' per aiuto.{RESET_COLOR}")
-            skip_next_auto_login = True
+        prompt_ready.set()
+
+    # Connectivity is watched in the background, so a drop is handled even while the menu waits for input
+    monitor = scheduler.CoalescingScheduler()
+    monitor.add_task(
+        "probe",
+        lambda: reconnect_if_offline(config, locations_map, username, password),
+        MONITOR_PROBE_INTERVAL, adaptive=True
+    )
 
-        time.sleep(0.1) # Small delay
+    run_login_check(config, locations_map, username, password)
+    prompt_ready.set()
+    monitor.run_forever(wait=wait_for_command, should_stop=lambda: not running)
 
     print(f"\n{INFO_COLOR}PratiLogin terminato. Arrivederci!{RESET_COLOR}")
     logging.info("Application shutdown gracefully.")
 
 if __name__ == "__main__":
+    exit_code = 0
     try:
-        main()
+        exit_code = main()
     except KeyboardInterrupt:
         print(f"\n{WARNING_COLOR}Uscita interrotta dall'utente.{RESET_COLOR}")
         logging.warning("Application terminated by user (KeyboardInterrupt).")
     except Exception as e:
-        print(f"{ERROR_COLOR}Si è verificato un errore imprevisto: {e}{RESET_COLOR}")
+        # stderr, so a --once --json consumer never reads it as the result
+        print(f"{ERROR_COLOR}Si è verificato un errore imprevisto: {e}{RESET_COLOR}", file=sys.stderr)
         logging.critical(f"Unhandled exception in main: {e}", exc_info=True)
+        exit_code = EXIT_CODE_UNEXPECTED_ERROR
     finally:
         logging.info("PratiLogin final shutdown sequence.")
-        sys.exit(0)
\ No newline at end of file
+    sys.exit(exit_code)
\ No newline at end of file
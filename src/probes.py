@@ -0,0 +1,81 @@
+# probes.py
+import ssl
+import socket
+import logging
+from typing import Callable, Tuple
+
+import requests
+
+from constants import (
+    PROBE_TIMEOUT,
+    PROBE_TLS_TARGET,
+    PROBE_TLS_HOSTNAME,
+    PROBE_HTTP_204_URL
+)
+from network_ops import check_internet_connection
+from tracing import span
+
+# Probe results. Cheap probes can only be trusted in one direction, so a probe
+# that cannot decide returns PROBE_UNKNOWN and the next backend is tried.
+# A failed cheap probe never decides OFFLINE by itself: timeouts and filtered
+# ports happen on working links too, so only positive evidence of the captive
+# portal (a redirect) or the full check may report offline.
+PROBE_ONLINE = "ONLINE"
+PROBE_OFFLINE = "OFFLINE"
+PROBE_UNKNOWN = "UNKNOWN"
+
+
+def probe_tls_handshake() -> str:
+    """
+    Verified TLS handshake with a public host, by IP (a few KB). A captive portal or
+    transparent proxy can accept the TCP connection but cannot present a valid
+    certificate for PROBE_TLS_HOSTNAME, so only a verified handshake means online.
+    """
+    context = ssl.create_default_context()
+    try:
+        with socket.create_connection(PROBE_TLS_TARGET, timeout=PROBE_TIMEOUT) as sock, \
+             context.wrap_socket(sock, server_hostname=PROBE_TLS_HOSTNAME):
+            return PROBE_ONLINE
+    except OSError as e: # ssl.SSLError is an OSError
+        logging.debug(f"TLS probe to {PROBE_TLS_TARGET} failed: {e}")
+        return PROBE_UNKNOWN
+
+
+def probe_http_204() -> str:
+    """HEAD to a generate_204 endpoint (a few hundred bytes). A redirect is the captive portal."""
+    try:
+        response = requests.head(PROBE_HTTP_204_URL, timeout=PROBE_TIMEOUT, allow_redirects=False)
+    except requests.RequestException as e:
+        logging.debug(f"HTTP 204 probe failed: {e}")
+        return PROBE_UNKNOWN
+    if response.status_code == 204:
+        return PROBE_ONLINE
+    if response.status_code in (301, 302, 307, 308):
+        return PROBE_OFFLINE
+    return PROBE_UNKNOWN
+
+
+# Backends in order of cost. Each returns a probe result.
+PROBE_BACKENDS: list[Tuple[str, Callable[[], str]]] = [
+    ("tls", probe_tls_handshake),
+    ("http_204", probe_http_204),
+]
+
+
+def probe_connectivity() -> Tuple[bool, str]:
+    """
+    Checks connectivity escalating from the cheapest probe: the first backend that
+    decides wins, and the full check_internet_connection() runs only if none did.
+    Returns (is_online, name_of_deciding_backend).
+    """
+    for name, backend in PROBE_BACKENDS:
+        with span("probe_connectivity", backend=name):
+            result = backend()
+        if result != PROBE_UNKNOWN:
+            logging.debug(f"Connectivity decided by '{name}' probe: {result}")
+            return result == PROBE_ONLINE, name
+
+    with span("probe_connectivity", backend="http_full"):
+        is_online = check_internet_connection()
+    logging.info(f"Connectivity decided by full HTTP check: {'online' if is_online else 'offline'}")
+    return is_online, "http_full"
@@ -0,0 +1,128 @@
+# scheduler.py
+import time
+import logging
+from typing import Callable
+
+from constants import (
+    MONITOR_TIMER_SLACK,
+    MONITOR_MAX_BACKOFF_AC,
+    MONITOR_MAX_BACKOFF_BATTERY,
+    MONITOR_MAX_WAIT,
+    MONITOR_RESUME_THRESHOLD
+)
+import system_ops
+
+
+class ScheduledTask:
+    """A periodic job. Adaptive tasks return True when the state they watch is stable."""
+
+    def __init__(self, name: str, func: Callable, interval: float, slack: float, adaptive: bool, first_due: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.slack = slack
+        self.adaptive = adaptive
+        self.backoff = 1 # Interval multiplier, grows while an adaptive task reports stability
+        self.next_due = first_due
+
+    @property
+    def current_interval(self) -> float:
+        return self.interval * self.backoff
+
+    @property
+    def deadline(self) -> float:
+        """Latest time the task may run: its due time plus the allowed slack."""
+        return self.next_due + self.slack * self.current_interval
+
+
+class CoalescingScheduler:
+    """
+    Runs periodic tasks with as few wakeups as possible.
+    The scheduler sleeps until the earliest task deadline and then runs every task
+    that is already due, so timers falling inside each other's slack share a wakeup.
+    Due times stay on each task's grid, so slack delays a run but never lowers the rate.
+    Adaptive tasks back off exponentially while stable, further when on battery.
+
+    The monotonic clock and sleeps stop during a system suspend, so waits are capped
+    at MONITOR_MAX_WAIT and every wakeup compares elapsed wall-clock time with
+    monotonic time. On resume the adaptive tasks drop their backoff and run at once.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic,
+                 on_battery: Callable[[], bool] = system_ops.is_on_battery,
+                 wall_clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.on_battery = on_battery
+        self.wall_clock = wall_clock
+        self.tasks: list[ScheduledTask] = []
+        self.wakeups = 0 # Returns from a timed wait, i.e. times the process was woken up
+        self._last_clock = clock()
+        self._last_wall_clock = wall_clock()
+
+    def add_task(self, name: str, func: Callable, interval: float,
+                 slack: float = MONITOR_TIMER_SLACK, adaptive: bool = False, run_now: bool = False):
+        """Registers func to run every interval seconds (first run immediately if run_now)."""
+        first_due = self.clock() + (0 if run_now else interval)
+        self.tasks.append(ScheduledTask(name, func, interval, slack, adaptive, first_due))
+
+    def next_wakeup(self) -> float:
+        """Clock time of the next wakeup (the earliest deadline over all tasks)."""
+        return min(task.deadline for task in self.tasks)
+
+    def run_pending(self):
+        """Runs every task that is due now."""
+        now = self.clock()
+        max_backoff = None
+        for task in self.tasks:
+            if task.next_due > now:
+                continue
+            try:
+                stable = task.func()
+            except Exception as e:
+                logging.error(f"Scheduled task '{task.name}' failed: {e}", exc_info=True)
+                stable = False
+            if task.adaptive:
+                if stable:
+                    if max_backoff is None: # Read power state at most once per wakeup
+                        max_backoff = MONITOR_MAX_BACKOFF_BATTERY if self.on_battery() else MONITOR_MAX_BACKOFF_AC
+                    task.backoff = min(task.backoff * 2, max_backoff)
+                else:
+                    task.backoff = 1
+            # Stay on the nominal grid: running within the slack must not stretch the interval
+            task.next_due += task.current_interval
+            if task.next_due < now: # Fell more than a whole interval behind (e.g. a slow task): skip missed runs
+                task.next_due = now + task.current_interval
+
+    def check_resumed(self) -> bool:
+        """
+        Detects a system suspend since the last check (wall-clock time advanced but the
+        monotonic clock did not). If so, adaptive tasks drop their backoff and become due now.
+        """
+        now, wall_now = self.clock(), self.wall_clock()
+        unseen = (wall_now - self._last_wall_clock) - (now - self._last_clock)
+        self._last_clock, self._last_wall_clock = now, wall_now
+        if unseen < MONITOR_RESUME_THRESHOLD: # Also ignores the wall clock being set back
+            return False
+        logging.info(f"Resume from suspend detected (about {unseen:.0f}s asleep).")
+        for task in self.tasks:
+            if task.adaptive:
+                task.backoff = 1
+                task.next_due = now
+        return True
+
+    def run_forever(self, wait: Callable[[float], None] = time.sleep,
+                    should_stop: Callable[[], bool] = lambda: False):
+        """
+        Main loop. wait(seconds) may return early (e.g. on user input); the
+        scheduler then simply waits again for the remaining time.
+        """
+        while not should_stop():
+            if self.check_resumed():
+                self.run_pending()
+                continue
+            delay = self.next_wakeup() - self.clock()
+            if delay > 0:
+                wait(min(delay, MONITOR_MAX_WAIT))
+                self.wakeups += 1
+                continue
+            self.run_pending()
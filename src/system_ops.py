@@ -21,6 +21,30 @@ def is_windows() -> bool:
     """Checks if the current OS is Windows."""
     return platform.system() == "Windows"
 
+POWER_SUPPLY_DIR = "/sys/class/power_supply"
+
+def _read_power_supply_attr(supply: str, attr: str) -> str:
+    try:
+        with open(os.path.join(POWER_SUPPLY_DIR, supply, attr)) as attr_file:
+            return attr_file.read().strip()
+    except OSError:
+        return ""
+
+def is_on_battery() -> bool:
+    """Checks if the machine runs on battery (Linux sysfs only; False elsewhere or if unknown)."""
+    try:
+        supplies = os.listdir(POWER_SUPPLY_DIR)
+    except OSError:
+        return False
+    discharging = False
+    for supply in supplies:
+        supply_type = _read_power_supply_attr(supply, "type")
+        if supply_type == "Mains" and _read_power_supply_attr(supply, "online") == "1":
+            return False # Plugged in
+        if supply_type == "Battery" and _read_power_supply_attr(supply, "status") == "Discharging":
+            discharging = True
+    return discharging
+
 def get_current_executable_path() -> str:
     """Gets the path of the currently running executable or script."""
     if getattr(sys, 'frozen', False):  # Bundled app (PyInstaller)
@@ -0,0 +1,125 @@
+# tracing.py
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import cProfile
+from contextlib import contextmanager
+
+from constants import PROFILE_STATS_FILE, TRACE_FILE
+
+# Active trace buffer. None means tracing is disabled and span() costs only a clock read.
+_trace_events: list | None = None
+_trace_origin = 0.0
+_trace_lock = threading.Lock()
+# Per-thread phase accumulator set by collect_phases(), independent of tracing
+_phase_local = threading.local()
+
+
+def start_trace():
+    """Starts collecting spans for the Chrome trace timeline."""
+    global _trace_events, _trace_origin
+    _trace_events = []
+    _trace_origin = time.perf_counter()
+
+
+def is_tracing() -> bool:
+    """Checks if spans are currently being collected."""
+    return _trace_events is not None
+
+
+@contextmanager
+def span(name: str, **span_args):
+    """
+    Records a named span around the wrapped block.
+    Spans opened inside another span are nested in the timeline by their timestamps.
+    The duration is also added to the dict of an active collect_phases() block.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        phases = getattr(_phase_local, 'phases', None)
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + (end - start) * 1000
+        if _trace_events is not None:
+            event = {
+                "name": name,
+                "ph": "X", # Complete event: start + duration
+                "ts": round((start - _trace_origin) * 1_000_000),
+                "dur": round((end - start) * 1_000_000),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            }
+            if span_args:
+                event["args"] = {key: str(value) for key, value in span_args.items()}
+            with _trace_lock:
+                _trace_events.append(event)
+
+
+@contextmanager
+def collect_phases():
+    """
+    Yields a dict that accumulates the duration (ms) of every span closed in this
+    thread, keyed by span name. Works whether or not a trace is being recorded.
+    """
+    previous = getattr(_phase_local, 'phases', None)
+    phases = {}
+    _phase_local.phases = phases
+    try:
+        yield phases
+    finally:
+        _phase_local.phases = previous
+
+
+def add_phases(phases: dict):
+    """Adds durations collected in another thread (e.g. a fan-out worker) to this thread's collect_phases() block."""
+    current = getattr(_phase_local, 'phases', None)
+    if current is None:
+        return
+    for name, ms in phases.items():
+        current[name] = current.get(name, 0.0) + ms
+
+
+def stop_trace(path: str = TRACE_FILE) -> str | None:
+    """Stops collecting spans and writes them as a Chrome trace JSON file. Returns the path written."""
+    global _trace_events
+    events, _trace_events = _trace_events, None
+    if events is None:
+        return None
+    try:
+        with open(path, 'w') as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+        logging.info(f"Trace with {len(events)} spans written to {path}")
+        return path
+    except IOError as e:
+        logging.error(f"Error writing trace file {path}: {e}")
+        return None
+
+
+def run_profiled(func, *args, **kwargs):
+    """
+    Runs func under cProfile with span tracing enabled.
+    Stats and trace are written even if func exits via sys.exit() or an exception.
+    """
+    profiler = cProfile.Profile()
+    start_trace()
+    profiler.enable()
+    try:
+        with span("session"):
+            return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        # Paths go to stderr, so a --once --json result on stdout stays parseable
+        try:
+            profiler.dump_stats(PROFILE_STATS_FILE)
+            logging.info(f"Profile stats written to {PROFILE_STATS_FILE}")
+            print(f"\nProfilo salvato in: {PROFILE_STATS_FILE}", file=sys.stderr)
+        except IOError as e:
+            logging.error(f"Error writing profile stats {PROFILE_STATS_FILE}: {e}")
+        trace_path = stop_trace()
+        if trace_path:
+            print(f"Timeline salvata in: {trace_path}", file=sys.stderr)
@@ -0,0 +1,80 @@
+# test_attempt_history.py
+# Unit tests for the attempt history aggregates against an in-memory SQLite database.
+#
+# Usage: python -m pytest tests (or python -m unittest discover tests)
+import os
+import sys
+import sqlite3
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import attempt_history # noqa: E402
+from constants import ( # noqa: E402
+    LOGIN_SUCCESSFUL,
+    ALREADY_CONNECTED,
+    NO_LOCATION_REACHABLE,
+    REACHABLE_AUTH_FAILED_401
+)
+
+
+def make_history(rows):
+    """rows: (ts, location, status, total_ms) tuples."""
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(attempt_history.SCHEMA)
+    conn.executemany("INSERT INTO attempts (ts, location, status, total_ms) VALUES (?, ?, ?, ?)", rows)
+    return conn
+
+
+class GroupStatsTest(unittest.TestCase):
+
+    def test_already_connected_is_left_out_of_the_success_rate(self):
+        conn = make_history([
+            (1, "viola", LOGIN_SUCCESSFUL, 100),
+            (2, "viola", REACHABLE_AUTH_FAILED_401, 50),
+            (3, None, ALREADY_CONNECTED, 10),
+        ])
+        stats = {row["group"]: row for row in attempt_history._group_stats(conn, "location")}
+        self.assertEqual(stats["viola"]["success_rate"], 0.5)
+        self.assertEqual(stats[None]["attempts"], 1)
+        self.assertIsNone(stats[None]["success_rate"]) # No login at all: no rate, not 0%
+
+    def test_percentiles_are_nearest_rank_over_successful_logins(self):
+        conn = make_history(
+            [(ts, "blu", LOGIN_SUCCESSFUL, float(ts * 100)) for ts in range(1, 21)] +
+            [(30, "blu", NO_LOCATION_REACHABLE, 99999)]
+        )
+        (row,) = attempt_history._group_stats(conn, "location")
+        self.assertEqual(row["p50_ms"], 1100)
+        self.assertEqual(row["p95_ms"], 2000)
+
+
+class WorstOutagesTest(unittest.TestCase):
+
+    def test_outages_are_ranked_by_duration(self):
+        conn = make_history([
+            (0, "viola", LOGIN_SUCCESSFUL, 100),
+            (10, "viola", NO_LOCATION_REACHABLE, None),
+            (20, "viola", NO_LOCATION_REACHABLE, None),
+            (30, None, ALREADY_CONNECTED, None), # Online again: ends the first outage
+            (40, "viola", NO_LOCATION_REACHABLE, None),
+            (100, "viola", LOGIN_SUCCESSFUL, 100),
+        ])
+        outages = attempt_history._worst_outages(conn, limit=5)
+        self.assertEqual([(o["start"], o["end"], o["failed_attempts"]) for o in outages],
+                         [(40, 100, 1), (10, 30, 2)])
+
+    def test_ongoing_outage_is_reported_and_limit_applies(self):
+        conn = make_history([
+            (0, "viola", NO_LOCATION_REACHABLE, None),
+            (5, "viola", LOGIN_SUCCESSFUL, 100),
+            (10, "viola", NO_LOCATION_REACHABLE, None),
+            (50, "viola", NO_LOCATION_REACHABLE, None),
+        ])
+        outages = attempt_history._worst_outages(conn, limit=1)
+        self.assertEqual(len(outages), 1)
+        self.assertEqual((outages[0]["start"], outages[0]["end"], outages[0]["duration_s"]), (10, 50, 40))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# test_fanout.py
+# Threaded tests of the fan-out login race, with requests.Session and the internet check stubbed.
+#
+# Usage: python -m pytest tests (or python -m unittest discover tests)
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest import mock
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import network_ops # noqa: E402
+from constants import LOGIN_SUCCESSFUL # noqa: E402
+
+
+class FakePortals:
+    """
+    Every portal answers GET and POST with 200. post_delay[host] delays the POST,
+    internet[host] is the result of the internet check after logging in there.
+    """
+
+    def __init__(self, post_delay: dict, internet: dict):
+        self.post_delay = post_delay
+        self.internet = internet
+        self.lock = threading.Lock()
+        self.open_sessions = set()
+        self.deletes = []
+        self.current = threading.local() # Host this worker thread last logged in to
+
+    def session(self):
+        portals = self
+
+        class Session:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def get(self, url, **kwargs):
+                return mock.Mock(status_code=200, text="")
+
+            def post(self, url, **kwargs):
+                host = urlsplit(url).hostname
+                time.sleep(portals.post_delay.get(host, 0))
+                with portals.lock:
+                    portals.open_sessions.add(host)
+                portals.current.host = host
+                return mock.Mock(status_code=200, text="")
+
+            def delete(self, url, **kwargs):
+                host = urlsplit(url).hostname
+                with portals.lock:
+                    portals.open_sessions.discard(host)
+                    portals.deletes.append(host)
+                return mock.Mock(status_code=200, text="")
+
+        return Session()
+
+    def wait_for_internet(self):
+        time.sleep(0.2) # Long enough for the other POSTs to return 200 meanwhile
+        return self.internet[self.current.host]
+
+
+def run_fanout(post_delay: dict, internet: dict):
+    portals = FakePortals(post_delay, internet)
+    locations = {host: f"https://{host}:444" for host in internet}
+    with mock.patch.object(network_ops.requests, "Session", portals.session), \
+         mock.patch.object(network_ops, "wait_for_internet", portals.wait_for_internet), \
+         mock.patch.object(network_ops.network_fingerprint, "get_current_fingerprint", lambda: None):
+        result = network_ops.try_login_fanout(locations, "user", "password", "", "", "", "", quiet=True)
+        deadline = time.monotonic() + 5 # Losers log out in their own threads after the result
+        while len(portals.open_sessions) > 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    return result, portals
+
+
+class FanoutRaceTest(unittest.TestCase):
+
+    def test_first_verified_login_wins_and_the_others_log_out(self):
+        (status, location), portals = run_fanout(
+            {"a": 0.0, "b": 0.05, "c": 0.05}, {"a": True, "b": True, "c": True}
+        )
+        self.assertEqual((status, location), (LOGIN_SUCCESSFUL, "a"))
+        self.assertEqual(portals.open_sessions, {"a"})
+        self.assertEqual(sorted(portals.deletes), ["b", "c"])
+
+    def test_failed_claimant_hands_over_to_a_waiting_location(self):
+        (status, location), portals = run_fanout(
+            {"a": 0.0, "b": 0.05, "c": 0.05}, {"a": False, "b": True, "c": False}
+        )
+        self.assertEqual((status, location), (LOGIN_SUCCESSFUL, "b"))
+        self.assertEqual(portals.open_sessions, {"b"})
+        self.assertEqual(sorted(portals.deletes), ["a", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
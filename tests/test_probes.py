@@ -0,0 +1,46 @@
+# test_probes.py
+# Unit tests for the escalation order of the connectivity probes, with patched backends.
+#
+# Usage: python -m pytest tests (or python -m unittest discover tests)
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import probes # noqa: E402
+from probes import PROBE_ONLINE, PROBE_OFFLINE, PROBE_UNKNOWN # noqa: E402
+
+
+def run_chain(tls: str, http_204: str, full_check: bool):
+    """Runs probe_connectivity() with fixed backend results. Returns (result, full check calls)."""
+    full = mock.Mock(return_value=full_check)
+    with mock.patch.object(probes, "PROBE_BACKENDS", [("tls", lambda: tls), ("http_204", lambda: http_204)]), \
+         mock.patch.object(probes, "check_internet_connection", full):
+        return probes.probe_connectivity(), full.call_count
+
+
+class ProbeChainTest(unittest.TestCase):
+
+    def test_tls_handshake_decides_online(self):
+        self.assertEqual(run_chain(PROBE_ONLINE, PROBE_OFFLINE, False), ((True, "tls"), 0))
+
+    def test_portal_redirect_decides_offline(self):
+        self.assertEqual(run_chain(PROBE_UNKNOWN, PROBE_OFFLINE, True), ((False, "http_204"), 0))
+
+    def test_failed_cheap_probes_escalate_to_the_full_check(self):
+        self.assertEqual(run_chain(PROBE_UNKNOWN, PROBE_UNKNOWN, True), ((True, "http_full"), 1))
+        self.assertEqual(run_chain(PROBE_UNKNOWN, PROBE_UNKNOWN, False), ((False, "http_full"), 1))
+
+    def test_tls_timeout_is_unknown(self):
+        with mock.patch.object(probes.socket, "create_connection", side_effect=TimeoutError("timed out")):
+            self.assertEqual(probes.probe_tls_handshake(), PROBE_UNKNOWN)
+
+    def test_http_204_timeout_is_unknown(self):
+        with mock.patch.object(probes.requests, "head", side_effect=probes.requests.Timeout("timed out")):
+            self.assertEqual(probes.probe_http_204(), PROBE_UNKNOWN)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+# test_scheduler.py
+# Unit tests for the CoalescingScheduler on a simulated clock.
+#
+# Usage: python -m pytest tests (or python -m unittest discover tests)
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from constants import MONITOR_MAX_BACKOFF_AC, MONITOR_MAX_BACKOFF_BATTERY, MONITOR_MAX_WAIT # noqa: E402
+from scheduler import CoalescingScheduler # noqa: E402
+
+
+class FakeClock:
+    """Monotonic clock (called) plus a wall clock that also advances during a simulated suspend."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.wall = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def wall_clock(self) -> float:
+        return self.wall
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+        self.wall += seconds
+
+    def suspend(self, seconds: float):
+        self.wall += seconds # Monotonic time and pending sleeps do not advance while suspended
+
+
+def make_scheduler(on_battery: bool = False):
+    clock = FakeClock()
+    return clock, CoalescingScheduler(clock=clock, on_battery=lambda: on_battery, wall_clock=clock.wall_clock)
+
+
+def run_until(clock: FakeClock, monitor: CoalescingScheduler, end: float):
+    monitor.run_forever(wait=clock.sleep, should_stop=lambda: clock.now >= end)
+
+
+class CoalescingSchedulerTest(unittest.TestCase):
+
+    def test_slack_delays_runs_but_keeps_the_interval(self):
+        clock, monitor = make_scheduler()
+        runs = []
+        monitor.add_task("probe", lambda: runs.append(clock.now), 30, slack=0.5)
+        run_until(clock, monitor, 300)
+        self.assertEqual(runs[0], 45) # Due at 30, run at the end of its slack
+        self.assertEqual({b - a for a, b in zip(runs, runs[1:])}, {30})
+
+    def test_timers_within_each_others_slack_share_a_wakeup(self):
+        clock, monitor = make_scheduler()
+        runs = {"a": [], "b": []}
+        monitor.add_task("a", lambda: runs["a"].append(clock.now), 30, slack=0.5)
+        monitor.add_task("b", lambda: runs["b"].append(clock.now), 40, slack=0.5)
+        run_until(clock, monitor, 60)
+        self.assertEqual(runs, {"a": [45], "b": [45]}) # b (due 40) rides a's wakeup at 45
+
+    def test_run_now_runs_at_the_first_wakeup(self):
+        clock, monitor = make_scheduler()
+        runs = []
+        monitor.add_task("probe", lambda: runs.append(clock.now), 30, slack=0.0, run_now=True)
+        run_until(clock, monitor, 61)
+        self.assertEqual(runs, [0, 30, 60])
+
+    def test_stable_adaptive_task_backs_off_up_to_the_ac_limit(self):
+        clock, monitor = make_scheduler(on_battery=False)
+        monitor.add_task("probe", lambda: True, 30, slack=0.0, adaptive=True)
+        task = monitor.tasks[0]
+        backoffs = []
+        for _ in range(6):
+            clock.now = task.next_due
+            monitor.run_pending()
+            backoffs.append(task.backoff)
+        self.assertEqual(backoffs, [2, 4, MONITOR_MAX_BACKOFF_AC, MONITOR_MAX_BACKOFF_AC,
+                                    MONITOR_MAX_BACKOFF_AC, MONITOR_MAX_BACKOFF_AC])
+
+    def test_battery_allows_a_longer_backoff(self):
+        clock, monitor = make_scheduler(on_battery=True)
+        monitor.add_task("probe", lambda: True, 30, slack=0.0, adaptive=True)
+        task = monitor.tasks[0]
+        for _ in range(10):
+            clock.now = task.next_due
+            monitor.run_pending()
+        self.assertEqual(task.backoff, MONITOR_MAX_BACKOFF_BATTERY)
+
+    def test_unstable_or_failing_task_resets_the_backoff(self):
+        clock, monitor = make_scheduler()
+        results = iter([True, True, False, True, RuntimeError("probe crashed")])
+
+        def probe():
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        monitor.add_task("probe", probe, 30, slack=0.0, adaptive=True)
+        task = monitor.tasks[0]
+        backoffs = []
+        for _ in range(5):
+            clock.now = task.next_due
+            monitor.run_pending()
+            backoffs.append(task.backoff)
+        self.assertEqual(backoffs, [2, 4, 1, 2, 1])
+
+    def test_missed_runs_are_skipped_after_a_long_pause(self):
+        clock, monitor = make_scheduler()
+        runs = []
+        monitor.add_task("probe", lambda: runs.append(clock.now), 30, slack=0.5)
+        clock.now = 1000 # e.g. blocked by a slow task
+        monitor.run_pending()
+        self.assertEqual(monitor.tasks[0].next_due, 1030)
+        self.assertEqual(runs, [1000])
+
+    def test_long_waits_are_split_so_a_resume_is_noticed(self):
+        clock, monitor = make_scheduler()
+        waits = []
+
+        def wait(seconds):
+            waits.append(seconds)
+            clock.sleep(seconds)
+
+        monitor.add_task("flush", lambda: None, 600, slack=1.0)
+        monitor.run_forever(wait=wait, should_stop=lambda: clock.now >= 1200)
+        self.assertTrue(all(seconds <= MONITOR_MAX_WAIT for seconds in waits))
+        self.assertEqual(sum(waits), 1200)
+
+    def test_resume_resets_the_backoff_and_probes_at_once(self):
+        clock, monitor = make_scheduler(on_battery=True)
+        runs = []
+        link_up = [True]
+
+        def probe():
+            runs.append(clock.now)
+            return link_up[0]
+
+        monitor.add_task("probe", probe, 30, slack=0.5, adaptive=True, run_now=True)
+        task = monitor.tasks[0]
+        resumed_at = None
+
+        def wait(seconds):
+            nonlocal resumed_at
+            if resumed_at is None and task.backoff == MONITOR_MAX_BACKOFF_BATTERY:
+                clock.suspend(3600) # Lid closed mid-wait; the link drops meanwhile
+                link_up[0] = False
+                resumed_at = clock.now
+            clock.sleep(min(seconds, 1)) # Woken shortly after resume (bounded wait)
+
+        monitor.run_forever(wait=wait, should_stop=lambda: resumed_at is not None and len(runs) > 8)
+        after_resume = [t for t in runs if t > resumed_at]
+        self.assertEqual(after_resume[0], resumed_at + 1) # Probed at the first wakeup after resume
+        self.assertEqual(task.backoff, 1)
+
+    def test_wall_clock_set_back_is_not_a_resume(self):
+        clock, monitor = make_scheduler()
+        monitor.add_task("probe", lambda: True, 30, adaptive=True)
+        monitor.tasks[0].backoff = 4
+        clock.wall -= 3600
+        self.assertFalse(monitor.check_resumed())
+        self.assertEqual(monitor.tasks[0].backoff, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()